@@ -0,0 +1,71 @@
+"""Seeded synthetic data for the benchmarks, so every run measures the same inputs."""
+import random
+import string
+
+WORDS = ["neki", "maneki", "hello", "hai", "hug", "wave", "pat", "flowers", "guild", "channel",
+         "message", "the", "a", "quick", "brown", "fox", "lazy", "dog", "cat", "bot", "why", "ok"]
+
+
+def rng(seed: int = 1337):
+    return random.Random(seed)
+
+
+def messages(count: int, *, seed: int = 1337, length: int = 12):
+    """Returns chat-like messages with punctuation and mixed case, most of which match no rule."""
+    r = rng(seed)
+    out = []
+    for _ in range(count):
+        words = [r.choice(WORDS) for _ in range(r.randint(1, length))]
+        if r.random() < 0.3:
+            words = [w.capitalize() for w in words]
+        out.append(' '.join(words) + r.choice(["", "!", "?", "...", " :)", "!!1"]))
+    return out
+
+
+def responses(count: int, *, seed: int = 1337):
+    """Returns a responses.json-shaped dict of count rules, each with a required literal keyword."""
+    r = rng(seed)
+    rules = {}
+    for i in range(count):
+        keyword = ''.join(r.choices(string.ascii_lowercase, k = 6))
+        rules[f"rule{i}"] = {"settings": {"regex": [f"h((a?i+)|(e(n|l)lo+)) {keyword}"]},
+                             "responses": [f"Response {i}.{n}" for n in range(5)]}
+    rules["hello"] = {"settings": {"regex": ["h((a?i+)|(e(n|l)lo+)) (ma)?neki"]},
+                      "responses": ["Hey!", "Hiya!", "Hai!", "Hi!", "Henlo!"]}
+    return rules
+
+
+def personalized(rules: dict, users: int, *, seed: int = 1337):
+    """Returns a personalized.json-shaped dict overriding a few responses for each user."""
+    r = rng(seed)
+    names = list(rules)
+    return {str(10 ** 17 + u): {r.choice(names): {"responses": [f"Hey user {u}!"]}} for u in range(users)}
+
+
+def nested(width: int, depth: int, *, seed: int = 1337):
+    """Returns a nested dict of the given width and depth with string, int and list leaves."""
+    r = rng(seed)
+
+    def level(d):
+        if d == 0:
+            return r.choice([r.randint(0, 10 ** 6), ''.join(r.choices(string.ascii_letters, k = 8)),
+                             [r.randint(0, 100) for _ in range(4)]])
+        return {f"k{i}": level(d - 1) for i in range(width)}
+
+    return level(depth)
+
+
+def extensions(count: int, *, seed: int = 1337):
+    """Returns a botSettings.json-shaped dict with count extensions, about half of them loaded."""
+    r = rng(seed)
+    return {"currActivity": "benchmarking",
+            "extensions": {f"cog{i}": {"load": r.random() < 0.5} for i in range(count)},
+            "guardians": [r.randint(10 ** 17, 10 ** 18) for _ in range(3)]}
+
+
+def menu_data(count: int):
+    """Returns a Menu-shaped dict of {label: coroutine function}."""
+    async def noop(**kwargs):
+        pass
+
+    return {f"Option {i}": noop for i in range(count)}
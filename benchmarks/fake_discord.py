@@ -0,0 +1,263 @@
+"""
+In-process stand-in for Discord's gateway and REST API, for load testing a real Maneki instance.
+
+The server speaks just enough of gateway v6 (HELLO, IDENTIFY, heartbeats, READY, GUILD_CREATE and
+dispatches) and of the REST API (login, gateway discovery, messages and reactions) for discord.py to
+connect and run normally, with any number of shards: each IDENTIFY gets the guilds Discord would
+put on its shard, and events are sent on the connection of the shard their guild belongs to.
+Every REST call is recorded, and messages the bot sends are echoed back over the gateway as
+MESSAGE_CREATE like Discord does, so menus can be driven with reactions. It also serves a canned
+Giphy search endpoint so CuteCog never leaves the machine.
+"""
+import asyncio
+import itertools
+import json
+import socket
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timezone
+
+from aiohttp import web, WSMsgType
+
+TIMESTAMP = datetime(2018, 1, 1, tzinfo = timezone.utc).isoformat()
+
+
+class FakeDiscord:
+    def __init__(self, *, guilds: int = 10, channels: int = 5, users: int = 50, shards: int = 1,
+                 host: str = '127.0.0.1'):
+        """
+        :param guilds: Number of fake guilds the bot is in
+        :param channels: Text channels per guild
+        :param users: Fake users, each a member of every guild
+        :param shards: Shard count recommended by /gateway/bot
+        :param host: Interface to listen on
+        """
+        self.host = host
+        self.port = None
+        self.shards = shards
+        # Spaced like real snowflakes, whose timestamp bits are what spread guilds over shards.
+        self._ids = itertools.count(400000000000000000, 1 << 22)
+
+        self.bot_user = self._user("Maneki", bot = True)
+        self.users = [self._user(f"user{i}") for i in range(users)]
+        self.guilds = [self._guild(f"guild{g}", channels) for g in range(guilds)]
+        self.channel_guild = {c['id']: g['id'] for g in self.guilds for c in g['channels']}
+
+        self.calls = Counter()  # "METHOD route" -> count
+        self.call_times = defaultdict(list)  # "METHOD route" -> server-side handling time (s)
+        self.reply_latency = []  # seconds from dispatching a message to the bot's reply arriving
+        self._awaiting_reply = defaultdict(deque)  # channel id -> dispatch times
+        self.sent_messages = deque(maxlen = 1000)  # (channel id, message id) of bot messages
+
+        self.ws = {}  # shard id -> gateway connection
+        self._seq = {}  # shard id -> sequence numbers of its session
+        self.ready = asyncio.Event()  # set once every recommended shard has identified
+        self._runner = None
+
+    def _id(self):
+        return str(next(self._ids))
+
+    def _user(self, name: str, *, bot: bool = False):
+        return {'id': self._id(), 'username': name, 'discriminator': '0001', 'avatar': None, 'bot': bot}
+
+    def _guild(self, name: str, channels: int):
+        guild_id = self._id()
+        return {
+            'id': guild_id, 'name': name, 'icon': None, 'splash': None, 'owner_id': self.users[0]['id'],
+            'region': 'us-east', 'afk_channel_id': None, 'afk_timeout': 300, 'verification_level': 0,
+            'default_message_notifications': 0, 'explicit_content_filter': 0, 'mfa_level': 0,
+            'system_channel_id': None, 'features': [], 'emojis': [], 'voice_states': [], 'presences': [],
+            'large': False, 'unavailable': False, 'joined_at': TIMESTAMP,
+            'member_count': len(self.users) + 1,
+            'roles': [{'id': guild_id, 'name': '@everyone', 'permissions': 104324161, 'position': 0,
+                       'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}],
+            'channels': [{'id': self._id(), 'type': 0, 'name': f"channel{c}", 'position': c,
+                          'permission_overwrites': [], 'topic': None, 'nsfw': False, 'parent_id': None}
+                         for c in range(channels)],
+            'members': [{'user': user, 'roles': [], 'joined_at': TIMESTAMP, 'deaf': False, 'mute': False,
+                         'nick': None} for user in self.users + [self.bot_user]],
+        }
+
+    # Server lifecycle
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/gateway', self.gateway)
+        app.router.add_route('*', '/api/{version}/{tail:.*}', self.rest)
+        app.router.add_get('/giphy/v1/gifs/search', self.giphy_search)
+
+        sock = socket.socket()
+        sock.bind((self.host, 0))
+        self.port = sock.getsockname()[1]
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.SockSite(self._runner, sock).start()
+
+    async def stop(self):
+        for ws in list(self.ws.values()):
+            await ws.close()
+        await self._runner.cleanup()
+
+    @property
+    def api_base(self):
+        return f"http://{self.host}:{self.port}/api/v7"
+
+    @property
+    def giphy_base(self):
+        return f"http://{self.host}:{self.port}/giphy"
+
+    # Gateway
+
+    def shard_for(self, guild_id: str):
+        return (int(guild_id) >> 22) % self.shards
+
+    async def gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        shard_id = None
+
+        await ws.send_str(json.dumps({'op': 10, 'd': {'heartbeat_interval': 41250, '_trace': ['fake-gateway']}}))
+
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            payload = json.loads(msg.data)
+            op = payload['op']
+
+            if op == 1:  # HEARTBEAT
+                await ws.send_str(json.dumps({'op': 11, 'd': None}))
+            elif op == 2:  # IDENTIFY
+                shard_id, shard_count = payload['d'].get('shard') or (0, 1)
+                self.shards = shard_count
+                self.ws[shard_id] = ws
+                self._seq[shard_id] = itertools.count(1)
+                await self._identify(shard_id)
+
+        if shard_id is not None and self.ws.get(shard_id) is ws:
+            del self.ws[shard_id]
+        self.ready.clear()
+        return ws
+
+    async def _identify(self, shard_id: int):
+        guilds = [g for g in self.guilds if self.shard_for(g['id']) == shard_id]
+        await self._send(shard_id, 0, {
+            'v': 6, 'user': self.bot_user, 'session_id': self._id(), 'private_channels': [],
+            'relationships': [], '_trace': ['fake-gateway'], 'shard': [shard_id, self.shards],
+            'guilds': [{'id': g['id'], 'unavailable': True} for g in guilds]}, event = 'READY')
+        for guild in guilds:
+            await self._send(shard_id, 0, guild, event = 'GUILD_CREATE')
+        if len(self.ws) == self.shards:
+            self.ready.set()
+
+    async def _send(self, shard_id: int, op: int, data, *, event: str = None):
+        ws = self.ws.get(shard_id)
+        if ws is None:
+            return
+        payload = {'op': op, 'd': data}
+        if op == 0:
+            payload['s'] = next(self._seq[shard_id])
+            payload['t'] = event
+        await ws.send_str(json.dumps(payload))
+
+    async def dispatch(self, event: str, data: dict):
+        """Sends an event on the shard of the guild it belongs to, or on shard 0 if none."""
+        guild_id = data.get('guild_id')
+        await self._send(self.shard_for(guild_id) if guild_id is not None else 0, 0, data, event = event)
+
+    # Events from fake users
+
+    def message_payload(self, channel_id: str, author: dict, content: str, *, message_id: str = None):
+        guild_id = self.channel_guild[channel_id]
+        return {'id': message_id or self._id(), 'channel_id': channel_id, 'guild_id': guild_id,
+                'author': author, 'content': content, 'timestamp': TIMESTAMP, 'edited_timestamp': None,
+                'tts': False, 'mention_everyone': False, 'mentions': [], 'mention_roles': [],
+                'attachments': [], 'embeds': [], 'pinned': False, 'type': 0,
+                'member': {'roles': [], 'joined_at': TIMESTAMP, 'deaf': False, 'mute': False}}
+
+    async def send_message(self, channel_id: str, author: dict, content: str, *, expect_reply: bool = False):
+        """Dispatches MESSAGE_CREATE from a fake user. Replies to it are timed if expect_reply."""
+        if expect_reply:
+            self._awaiting_reply[channel_id].append(time.perf_counter())
+        await self.dispatch('MESSAGE_CREATE', self.message_payload(channel_id, author, content))
+
+    async def add_reaction(self, channel_id: str, message_id: str, user: dict, emoji: str):
+        """Dispatches MESSAGE_REACTION_ADD from a fake user."""
+        await self.dispatch('MESSAGE_REACTION_ADD', {
+            'user_id': user['id'], 'channel_id': channel_id, 'message_id': message_id,
+            'guild_id': self.channel_guild[channel_id], 'emoji': {'id': None, 'name': emoji}})
+
+    # REST
+
+    async def rest(self, request):
+        start = time.perf_counter()
+        tail = request.match_info['tail']
+        route = self._route(request.method, tail)
+        self.calls[route] += 1
+
+        body = None
+        if request.can_read_body:
+            try:
+                body = await request.json()
+            except ValueError:
+                body = None  # multipart uploads and the like
+
+        response = await self._respond(request.method, tail.split('/'), body)
+        self.call_times[route].append(time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def _route(method: str, tail: str):
+        """Collapses snowflakes so calls group by endpoint, e.g. 'POST channels/{id}/messages'."""
+        parts = ['{id}' if part.isdigit() else part for part in tail.split('/')]
+        if len(parts) > 5 and parts[4] == 'reactions':
+            parts[5] = '{emoji}'
+        return f"{method} {'/'.join(parts)}"
+
+    async def _respond(self, method: str, parts: list, body):
+        if parts[:1] == ['gateway']:
+            data = {'url': f"ws://{self.host}:{self.port}/gateway"}
+            if parts[1:] == ['bot']:
+                data['shards'] = self.shards
+            return web.json_response(data)
+
+        if parts == ['users', '@me']:
+            return web.json_response(self.bot_user)
+
+        if parts[:1] == ['channels'] and len(parts) >= 3 and parts[2] == 'messages':
+            channel_id = parts[1]
+
+            if method == 'POST' and len(parts) == 3:
+                reply = self.message_payload(channel_id, self.bot_user, (body or {}).get('content') or '')
+                reply['embeds'] = [body['embed']] if body and body.get('embed') else []
+                self.sent_messages.append((channel_id, reply['id']))
+
+                waiting = self._awaiting_reply.get(channel_id)
+                if waiting:
+                    self.reply_latency.append(time.perf_counter() - waiting.popleft())
+
+                # Discord echoes the bot's own messages over the gateway, which is what caches them.
+                if self.ws:
+                    asyncio.ensure_future(self.dispatch('MESSAGE_CREATE', reply))
+                return web.json_response(reply)
+
+            if method == 'PATCH' and len(parts) == 4:
+                edited = self.message_payload(channel_id, self.bot_user, (body or {}).get('content') or '',
+                                              message_id = parts[3])
+                edited['embeds'] = [body['embed']] if body and body.get('embed') else []
+                return web.json_response(edited)
+
+        if method in ('PUT', 'DELETE'):
+            return web.Response(status = 204)
+
+        return web.json_response({})
+
+    # Giphy
+
+    async def giphy_search(self, request):
+        self.calls['GET giphy/search'] += 1
+        limit = int(request.query.get('limit', 10))
+        query = request.query.get('q', '')
+        return web.json_response({'data': [
+            {'images': {'original': {'url': f"http://{self.host}:{self.port}/gifs/{query}/{i}.gif"}}}
+            for i in range(limit)]})
@@ -0,0 +1,198 @@
+"""
+End-to-end load test of a real Maneki instance against the in-process fake Discord.
+
+Boots Maneki with every cog enabled, connects it to benchmarks.fake_discord, and feeds it a mix of
+chatter, TalkerCog triggers, commands and reactions at a fixed rate across many fake guilds and
+channels. Reports reply latency, outbound API calls and event-loop lag. No token or network needed.
+
+    python -m benchmarks.loadtest --rate 500 --duration 30 --guilds 100 --channels 10
+    python -m benchmarks.loadtest --shards 4 --guilds 400
+    python -m benchmarks.loadtest --mix chat=50,talk=20,command=25,reaction=5 --json results.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+from benchmarks import scratch
+
+CHATTER = ["lol", "anyone around?", "that was a good game", "brb", "what's for dinner", "ok", "nice!!"]
+TALKERS = ["hi neki", "hello maneki!", "haiii neki", "henlo neki"]
+EMOJIS = ["\N{HEAVY BLACK HEART}", "\N{THUMBS UP SIGN}", "\N{BLACK RIGHTWARDS ARROW}"]
+
+
+def percentiles(values: list, *pcts):
+    ordered = sorted(values)
+    if not ordered:
+        return [None for _ in pcts]
+    return [ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in pcts]
+
+
+def parse_mix(mix: str):
+    weights = {}
+    for part in mix.split(','):
+        kind, weight = part.split('=')
+        weights[kind.strip()] = float(weight)
+    return weights
+
+
+class LoopLag:
+    """Measures how late the event loop wakes a sleeping task, sampled every interval seconds."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(time.perf_counter() - start - self.interval)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        self._task.cancel()
+
+
+async def drive(fake, args, counts: Counter):
+    """Sends events at args.rate per second for args.duration seconds."""
+    weights = parse_mix(args.mix)
+    kinds, kind_weights = list(weights), list(weights.values())
+    channels = list(fake.channel_guild)
+    commands = [f"!!{command}" for command in args.commands]
+
+    start = time.perf_counter()
+    sent = 0
+    while True:
+        elapsed = time.perf_counter() - start
+        if elapsed >= args.duration:
+            break
+
+        due = int(elapsed * args.rate) - sent
+        for _ in range(due):
+            kind = random.choices(kinds, kind_weights)[0]
+            channel = random.choice(channels)
+            user = random.choice(fake.users)
+
+            if kind == 'chat':
+                await fake.send_message(channel, user, random.choice(CHATTER))
+            elif kind == 'talk':
+                await fake.send_message(channel, user, random.choice(TALKERS), expect_reply = True)
+            elif kind == 'command':
+                await fake.send_message(channel, user, random.choice(commands), expect_reply = True)
+            elif kind == 'reaction' and fake.sent_messages:
+                channel, message = random.choice(fake.sent_messages)
+                await fake.add_reaction(channel, message, user, random.choice(EMOJIS))
+            else:
+                continue
+            counts[kind] += 1
+        sent += due
+
+        await asyncio.sleep(0.005)
+
+    return time.perf_counter() - start
+
+
+async def run(args):
+    import discord
+    from discord.http import Route
+    from benchmarks.fake_discord import FakeDiscord
+
+    fake = FakeDiscord(guilds = args.guilds, channels = args.channels, users = args.users,
+                       shards = args.shards)
+    await fake.start()
+    Route.BASE = fake.api_base
+
+    import cogs.cutecog
+    from cogs.utils.settings import settings
+    from maneki import Maneki
+
+    cogs.cutecog.GIPHY_API = fake.giphy_base
+    for extension in list(settings.unloaded_extensions):
+        settings.enable_extension(extension)
+
+    bot = Maneki()
+    bot.load_cogs()
+
+    completed = Counter()
+
+    async def on_command_completion(ctx):
+        completed[ctx.command.qualified_name] += 1
+
+    async def on_command_error(ctx, error):
+        completed[f"error:{type(error).__name__}"] += 1
+
+    bot.add_listener(on_command_completion)
+    bot.add_listener(on_command_error)
+
+    login = asyncio.ensure_future(bot.start('fake-token'))
+    await asyncio.wait_for(bot.wait_until_ready(), timeout = 60)
+    print(f"Maneki ready in {len(bot.guilds)} fake guilds on {bot.shard_count} shards, "
+          f"discord.py {discord.__version__}.\n")
+
+    lag = LoopLag()
+    lag.start()
+    counts = Counter()
+    elapsed = await drive(fake, args, counts)
+    await asyncio.sleep(args.drain)  # let in-flight replies land
+    lag.stop()
+
+    shards = bot.shard_stats.report(bot)
+    await bot.logout()
+    await fake.stop()
+    login.cancel()
+
+    p50, p95, p99 = percentiles(fake.reply_latency, 50, 95, 99)
+    lag50, lag99 = percentiles(lag.samples, 50, 99)
+    report = {
+        "config": vars(args),
+        "events": dict(counts),
+        "events_per_sec": sum(counts.values()) / elapsed,
+        "replies": len(fake.reply_latency),
+        "reply_latency_ms": {"p50": p50 and p50 * 1e3, "p95": p95 and p95 * 1e3, "p99": p99 and p99 * 1e3},
+        "loop_lag_ms": {"p50": lag50 and lag50 * 1e3, "p99": lag99 and lag99 * 1e3,
+                        "max": max(lag.samples, default = 0) * 1e3},
+        "api_calls": dict(fake.calls),
+        "api_calls_per_sec": sum(fake.calls.values()) / elapsed,
+        "commands": dict(completed),
+        "shards": [{"shard": row['shard'], "guilds": row['guilds'], "events": row['events']} for row in shards],
+    }
+
+    print(json.dumps(report, indent = 2))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent = 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Load test Maneki against a fake Discord.")
+    parser.add_argument('--rate', type = float, default = 200, help = "Events sent per second.")
+    parser.add_argument('--duration', type = float, default = 10, help = "Seconds to send events for.")
+    parser.add_argument('--drain', type = float, default = 2, help = "Seconds to wait for replies afterwards.")
+    parser.add_argument('--guilds', type = int, default = 20)
+    parser.add_argument('--channels', type = int, default = 5, help = "Channels per guild.")
+    parser.add_argument('--users', type = int, default = 50)
+    parser.add_argument('--shards', type = int, default = 1, help = "Shard count the fake gateway recommends.")
+    parser.add_argument('--mix', default = 'chat=80,talk=8,command=10,reaction=2',
+                        help = "Relative weights of chat, talk, command and reaction events.")
+    parser.add_argument('--commands', nargs = '*', default = ['hug', 'wave', 'headpat'])
+    parser.add_argument('--seed', type = int, default = 1337)
+    parser.add_argument('--json', help = "Also write the report to this file.")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    directory = scratch.enter(prefix = 'maneki-load-')
+    try:
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(run(args))
+    finally:
+        scratch.leave(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""
+Micro-benchmarks for the text and data hot paths.
+
+Runs offline against synthetic corpora of several sizes and reports ops/sec, p50/p99 latency and
+the peak memory allocated per call. Results can be saved as a baseline and later runs compared
+against it, exiting non-zero when a benchmark regresses past the tolerance.
+
+    python -m benchmarks.run                    # run and compare against benchmarks/baseline.json
+    python -m benchmarks.run --save             # run and save the results as the new baseline
+    python -m benchmarks.run -k talker --sizes 10 1000
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from benchmarks import corpora, scratch
+
+BASELINE = os.path.join(scratch.ROOT, 'benchmarks', 'baseline.json')
+SCRATCH = scratch.enter()
+
+BENCHMARKS = []
+
+
+def benchmark(name: str):
+    """Registers a setup function. It takes a corpus size and returns the zero-argument callable to time."""
+    def decorator(func):
+        BENCHMARKS.append((name, func))
+        return func
+    return decorator
+
+
+class Cycle:
+    """Hands out the items of a corpus round-robin so consecutive calls don't repeat one input."""
+
+    def __init__(self, items):
+        self.items = items
+        self.i = -1
+
+    def __call__(self):
+        self.i = (self.i + 1) % len(self.items)
+        return self.items[self.i]
+
+
+@benchmark('text.clean')
+def bench_clean(size):
+    from cogs.utils.text_formatter import txt_frmt
+    msgs = Cycle(corpora.messages(1000, length = size))
+    return lambda: txt_frmt.clean(msgs())
+
+
+@benchmark('text.regscan')
+def bench_regscan(size):
+    from cogs.utils.text_formatter import txt_frmt
+    regex = [rule['settings']['regex'][0] for rule in corpora.responses(size).values()]
+    msgs = Cycle(corpora.messages(1000))
+    return lambda: txt_frmt.regscan(msgs(), regex)
+
+
+@benchmark('text.d_chunk')
+def bench_d_chunk(size):
+    from cogs.utils.text_formatter import txt_frmt
+    data = {f"key{i}": i for i in range(size)}
+    return lambda: list(txt_frmt.d_chunk(data, 5))
+
+
+@benchmark('text.l_chunk')
+def bench_l_chunk(size):
+    from cogs.utils.text_formatter import txt_frmt
+    data = list(range(size))
+    return lambda: list(txt_frmt.l_chunk(data, 10))
+
+
+@benchmark('text.pagify')
+def bench_pagify(size):
+    from cogs.utils.text_formatter import txt_frmt
+    data = [f"item {i}" for i in range(size)]
+    devnull = open(os.devnull, 'w')
+
+    def run():
+        with contextlib.redirect_stdout(devnull):  # pagify pretty-prints its result
+            txt_frmt.pagify(data)
+    return run
+
+
+@benchmark('dataio.merge')
+def bench_merge(size):
+    from copy import deepcopy
+    from cogs.utils.dataIO import dataIO
+    a = corpora.nested(size, 2, seed = 1)
+    b = corpora.nested(size, 2, seed = 2)
+    return lambda: dataIO.merge(deepcopy(a), b)
+
+
+@benchmark('dataio.load_json')
+def bench_load_json(size):
+    from cogs.utils.dataIO import DataIO
+    io = DataIO()
+    io.path = tempfile.mkdtemp(dir = SCRATCH)
+    io.dump_json('bench.json', corpora.nested(size, 2))
+    return lambda: io.load_json('bench.json')
+
+
+@benchmark('dataio.dump_json')
+def bench_dump_json(size):
+    from cogs.utils.dataIO import DataIO
+    io = DataIO()
+    io.path = tempfile.mkdtemp(dir = SCRATCH)
+    data = corpora.nested(size, 2)
+    return lambda: io.dump_json('bench.json', data)
+
+
+@benchmark('settings.loaded_extensions')
+def bench_loaded_extensions(size):
+    from cogs.utils.settings import Settings
+    s = Settings.__new__(Settings)  # skip __init__, which reads botSettings.json and lists cogs/
+    s.bot_settings = corpora.extensions(size)
+    s._views = None
+    return lambda: s.loaded_extensions
+
+
+@benchmark('menu.pages')
+def bench_menu_pages(size):
+    from cogs.utils.menu import Menu
+    menu = Menu(None, corpora.menu_data(size), "Benchmark")
+    return lambda: menu.pages
+
+
+@benchmark('talker.check_response')
+def bench_check_response(size):
+    from cogs.talkercog import TalkerCog
+    from cogs.utils.matcher import ConversationIndex
+    rules = corpora.responses(size)
+    index = ConversationIndex(rules, corpora.personalized(rules, 20))
+    users = list(index.personalized) + [1, 2, 3, 4, 5]
+    msgs = [SimpleNamespace(content = content, author = SimpleNamespace(id = users[i % len(users)]))
+            for i, content in enumerate(corpora.messages(1000))]
+    msgs = Cycle(msgs)
+
+    def run():
+        message = msgs()
+        matcher = index.for_user(message.author.id)
+        if matcher is not None:
+            TalkerCog.check_response(message, matcher)
+    return run
+
+
+@benchmark('talker.build_index')
+def bench_build_index(size):
+    from cogs.utils.matcher import ConversationIndex
+    rules = corpora.responses(size)
+    personalized = corpora.personalized(rules, 20)
+    return lambda: ConversationIndex(rules, personalized)
+
+
+@benchmark('talker.snapshot_load')
+def bench_snapshot_load(size):
+    from cogs.utils import snapshot
+    from cogs.utils.matcher import ConversationIndex
+    rules = corpora.responses(size)
+    personalized = corpora.personalized(rules, 20)
+    snapshot.save(f"bench{size}", size, ConversationIndex(rules, personalized))
+    return lambda: snapshot.load(f"bench{size}", size, None)
+
+
+def measure(func, *, min_time: float, min_calls: int):
+    """Returns per-call latencies in ns and the median peak bytes allocated per call."""
+    for _ in range(min(10, min_calls)):  # warm up caches and lazy state
+        func()
+
+    gc.collect()
+    latencies = []
+    clock = time.perf_counter_ns
+    deadline = time.perf_counter() + min_time
+    while len(latencies) < min_calls or time.perf_counter() < deadline:
+        start = clock()
+        func()
+        latencies.append(clock() - start)
+
+    peaks = []
+    tracemalloc.start()
+    for _ in range(min(50, min_calls)):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        func()
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    return latencies, sorted(peaks)[len(peaks) // 2]
+
+
+def percentile(ordered: list, pct: float):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(names: list, sizes: list, *, min_time: float, min_calls: int):
+    results = {}
+    for name, setup in BENCHMARKS:
+        if names and not any(n in name for n in names):
+            continue
+        for size in sizes:
+            key = f"{name}[{size}]"
+            try:
+                func = setup(size)
+            except ImportError as e:
+                print(f"{key:<40} skipped || {type(e)}: {e}")
+                break
+
+            latencies, alloc = measure(func, min_time = min_time, min_calls = min_calls)
+            ordered = sorted(latencies)
+            results[key] = {"ops": len(latencies) / (sum(latencies) / 1e9),
+                            "p50_us": percentile(ordered, 50) / 1e3,
+                            "p99_us": percentile(ordered, 99) / 1e3,
+                            "alloc_b": alloc}
+            print(f"{key:<40} {results[key]['ops']:>12,.0f} ops/s  p50 {results[key]['p50_us']:>10.2f} us  "
+                  f"p99 {results[key]['p99_us']:>10.2f} us  alloc {alloc:>10,} B")
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Prints the change against the baseline and returns the keys that regressed past the tolerance."""
+    regressions = []
+    print(f"\nCompared to baseline from {baseline['meta']['time']} ({baseline['meta']['python']}):")
+    for key, result in results.items():
+        old = baseline['results'].get(key)
+        if old is None:
+            continue
+        ops = result['ops'] / old['ops'] - 1
+        p99 = result['p99_us'] / old['p99_us'] - 1 if old['p99_us'] else 0
+        flag = ops < -tolerance or p99 > tolerance * 2
+        if flag:
+            regressions.append(key)
+        print(f"{key:<40} ops {ops:>+8.1%}  p99 {p99:>+8.1%}{'  REGRESSION' if flag else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Maneki micro-benchmarks.")
+    parser.add_argument('-k', dest = 'names', nargs = '*', default = [],
+                        help = "Only run benchmarks whose name contains one of these.")
+    parser.add_argument('--sizes', nargs = '*', type = int, default = [10, 100, 1000])
+    parser.add_argument('--min-time', type = float, default = 0.5, help = "Seconds to time each benchmark for.")
+    parser.add_argument('--min-calls', type = int, default = 20)
+    parser.add_argument('--baseline', default = BASELINE)
+    parser.add_argument('--save', action = 'store_true', help = "Save the results as the new baseline.")
+    parser.add_argument('--tolerance', type = float, default = 0.2,
+                        help = "Allowed ops/sec drop (p99 may grow by twice this) before a regression.")
+    args = parser.parse_args()
+
+    try:
+        results = run(args.names, args.sizes, min_time = args.min_time, min_calls = args.min_calls)
+    finally:
+        scratch.leave(SCRATCH)
+
+    if args.save:
+        with open(args.baseline, 'w') as file:
+            json.dump({"meta": {"time": time.ctime(), "python": platform.python_version(),
+                                "machine": platform.machine()},
+                       "results": results}, file, indent = 2)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif os.path.isfile(args.baseline):
+        with open(args.baseline) as file:
+            if compare(results, json.load(file), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""Scratch working directory for running Maneki code without touching the real data/ folder."""
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def enter(prefix: str = 'maneki-bench-'):
+    """
+    Copies data/ into a temporary directory, links cogs/ next to it and makes it the working
+    directory. The cogs resolve data/ relative to the working directory, and importing settings
+    rewrites botSettings.json, so this keeps benchmark runs from editing the real files.
+
+    :return: The scratch directory's path
+    :rtype: str
+    """
+    scratch = tempfile.mkdtemp(prefix = prefix)
+    shutil.copytree(os.path.join(ROOT, 'data'), os.path.join(scratch, 'data'))
+    os.makedirs(os.path.join(scratch, 'data', 'logs'), exist_ok = True)
+    os.symlink(os.path.join(ROOT, 'cogs'), os.path.join(scratch, 'cogs'))
+    os.chdir(scratch)
+
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return scratch
+
+
+def leave(scratch: str):
+    """Returns to the repository root and deletes the scratch directory."""
+    os.chdir(ROOT)
+    shutil.rmtree(scratch, ignore_errors = True)
@@ -0,0 +1,232 @@
+"""
+Runs Maneki as a cluster of worker processes, each running its own range of shards, so the bot's
+load is spread over several cores.
+
+    python cluster.py --workers 4
+    python cluster.py --workers 4 --shards 16
+
+The supervisor restarts any worker that crashes, backing off if it keeps crashing, and relays IPC
+messages between workers (see cogs.utils.ipc). Settings changes such as changePlaying reach every
+worker this way, and each worker's shard stats are shared with all of them. Each worker writes its
+own log files, such as data/logs/maneki-0.log, since rotating files can't be shared by processes.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from multiprocessing.connection import wait
+
+# Discord lets a bot identify one shard every 5 seconds.
+IDENTIFY_INTERVAL = 5
+# Restart backoff for crashing workers: doubles from MIN to MAX, reset once a worker stays up for STABLE.
+RESTART_MIN = 1
+RESTART_MAX = 60
+RESTART_STABLE = 60
+
+_logger = logging.getLogger("maneki.cluster")
+
+
+def shard_ranges(shard_count: int, workers: int):
+    """
+    Splits shards 0..shard_count-1 into contiguous ranges, one per worker.
+
+    :rtype: list
+    """
+    workers = min(workers, shard_count)
+    size, extra = divmod(shard_count, workers)
+    ranges, start = [], 0
+    for worker in range(workers):
+        end = start + size + (1 if worker < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def recommended_shards(token: str):
+    """
+    Asks Discord how many shards the bot should run.
+
+    :rtype: int
+    """
+    import aiohttp
+    from discord.http import Route
+
+    async def fetch():
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{Route.BASE}/gateway/bot", headers = {'Authorization': f"Bot {token}"}) as r:
+                r.raise_for_status()
+                return (await r.json())['shards']
+
+    return asyncio.get_event_loop().run_until_complete(fetch())
+
+
+def run_worker(cluster_id: int, shard_ids: list, shard_count: int, conn, delay: float):
+    """Entry point of a worker process: one Maneki running the given shards."""
+    time.sleep(delay)  # wait for the workers before it to identify their shards
+
+    from cogs.utils.ipc import WorkerIPC
+    from cogs.utils.settings import settings
+    from maneki import Maneki
+
+    bot = Maneki(shard_ids = shard_ids, shard_count = shard_count, cluster_id = cluster_id)
+    bot.ipc = WorkerIPC(bot, conn, cluster_id)
+    bot.ipc.start()
+    if settings.loaded_extensions != {}:
+        bot.load_cogs()
+
+    bot.logger.info(f"Cluster worker {cluster_id} running shards {shard_ids[0]}-{shard_ids[-1]} "
+                    f"of {shard_count}.")
+    bot.run(settings.token, reconnect = True)
+
+
+class Worker:
+    """The supervisor's handle on one worker process."""
+
+    def __init__(self, cluster_id: int, shard_ids: list):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.process = None
+        self.conn = None
+        self.started = None
+        self.restart_at = None
+        self.backoff = RESTART_MIN
+        self.stats = None
+
+
+class Supervisor:
+    def __init__(self, shard_count: int, workers: int):
+        self.shard_count = shard_count
+        self.workers = [Worker(cluster_id, shard_ids)
+                        for cluster_id, shard_ids in enumerate(shard_ranges(shard_count, workers))]
+        self._context = multiprocessing.get_context('spawn')
+        self._stopping = False
+
+    def start(self, worker: Worker, delay: float = 0):
+        parent, child = self._context.Pipe()
+        worker.process = self._context.Process(
+            target = run_worker, name = f"maneki-{worker.cluster_id}",
+            args = (worker.cluster_id, worker.shard_ids, self.shard_count, child, delay))
+        worker.process.start()
+        child.close()
+        worker.conn = parent
+        worker.started = time.monotonic()
+        worker.restart_at = None
+        _logger.info(f"Started worker {worker.cluster_id} (pid {worker.process.pid}) "
+                     f"for shards {worker.shard_ids[0]}-{worker.shard_ids[-1]}.")
+
+    def stop(self, *args):
+        self._stopping = True
+
+    def send(self, worker: Worker, message: dict):
+        if worker.conn is None:
+            return
+        try:
+            worker.conn.send(message)
+        except (OSError, EOFError):
+            pass  # the worker is exiting and will be handled as such
+
+    def handle(self, worker: Worker, message: dict):
+        op = message['op']
+        if op == 'broadcast':
+            for other in self.workers:
+                if other is not worker:
+                    self.send(other, message)
+        elif op == 'stats':
+            worker.stats = message
+            workers = {w.cluster_id: w.stats for w in self.workers if w.stats is not None}
+            self.send(worker, {'op': 'cluster_stats', 'workers': workers})
+
+    def exited(self, worker: Worker):
+        worker.process.join(timeout = 10)
+        if worker.process.is_alive():  # closed its pipe but hung on the way out
+            worker.process.kill()
+            worker.process.join()
+        code = worker.process.exitcode
+        worker.conn.close()
+        worker.conn = None
+        worker.stats = None
+
+        if self._stopping:
+            return
+        if code == 0:
+            _logger.info(f"Worker {worker.cluster_id} logged out, not restarting it.")
+            return
+
+        if time.monotonic() - worker.started >= RESTART_STABLE:
+            worker.backoff = RESTART_MIN
+        _logger.warning(f"Worker {worker.cluster_id} exited with code {code}, "
+                        f"restarting it in {worker.backoff}s.")
+        worker.restart_at = time.monotonic() + worker.backoff
+        worker.backoff = min(worker.backoff * 2, RESTART_MAX)
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        for worker in self.workers:
+            # Stagger boots so each worker's shards identify after the previous worker's.
+            self.start(worker, delay = worker.shard_ids[0] * IDENTIFY_INTERVAL)
+
+        while not self._stopping:
+            now = time.monotonic()
+            for worker in self.workers:
+                if worker.restart_at is not None and worker.restart_at <= now:
+                    self.start(worker)
+
+            by_handle = {}
+            for worker in self.workers:
+                if worker.conn is not None:
+                    by_handle[worker.conn] = worker
+                    by_handle[worker.process.sentinel] = worker
+            if not by_handle and all(worker.restart_at is None for worker in self.workers):
+                break  # every worker logged out
+
+            for ready in wait(list(by_handle), timeout = 1):
+                worker = by_handle[ready]
+                if worker.conn is None:
+                    continue  # already handled through its other handle
+                if ready is worker.conn:
+                    try:
+                        while worker.conn.poll():
+                            self.handle(worker, worker.conn.recv())
+                        continue
+                    except (OSError, EOFError):
+                        pass  # the worker closed its end, so it is exiting
+                self.exited(worker)
+
+        self.shutdown()
+
+    def shutdown(self):
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(timeout = 30)
+                if worker.process.is_alive():
+                    worker.process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Run Maneki as a cluster of shard processes.")
+    parser.add_argument('--workers', type = int, default = os.cpu_count() or 1,
+                        help = "Worker processes to start (default: one per core).")
+    parser.add_argument('--shards', type = int,
+                        help = "Total shard count (default: botSettings.json's, else Discord's recommendation).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout,
+                        format = '%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    from cogs.utils.settings import settings
+    shard_count = args.shards or settings.sharding.get('shard_count') or recommended_shards(settings.token)
+
+    Supervisor(shard_count, args.workers).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,108 @@
+import asyncio
+import logging
 import random
-import json
-import discord
 import aiohttp
+import discord
 from discord.ext import commands
+from .utils.breaker import CircuitOpen, breaker
+from .utils.cache import TTLCache
+from .utils.metrics import metrics
+from .utils.singleflight import SingleFlight
+
+GIPHY_API = 'http://api.giphy.com'
+GIPHY_KEY = 'NLUaerigtVW04pj4P4slXZOexvpC5VN3'
+
+# Giphy searches kept warm for the commands, by command.
+QUERIES = {'hug': 'manga hug', 'wave': 'kawaii wave', 'headpat': 'headpat anime'}
+SEARCH_LIMIT = 25  # GIFs fetched per search, picked from at random
+CACHE_TTL = 60 * 60  # seconds a search's results are served for
+REFRESH_INTERVAL = 45 * 60  # seconds between background refreshes, shorter than CACHE_TTL
+
+# Seconds a command waits on Giphy before replying with a stale GIF or none at all.
+COMMAND_BUDGET = 1.5
+
+SEARCH_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ValueError, CircuitOpen)
 
 
 class CuteCog:
     def __init__(self, bot):
         self.bot = bot
+        self.logger = logging.getLogger("maneki")
+
+        self.giphy = breaker("giphy", slow_call = COMMAND_BUDGET)
+        self.gifs = TTLCache(maxsize = 64, ttl = CACHE_TTL)
+        self._stale = {}  # query -> last good results, served once the cache expires and Giphy is failing
+        self._searches = SingleFlight()  # a burst of commands on a cold pool shares one search
+        self._prefetch = self.bot.loop.create_task(self.prefetch_gifs())
+
+    def __unload(self):
+        self._prefetch.cancel()
+
+    async def _search(self, query: str):
+        params = {'q': query, 'api_key': GIPHY_KEY, 'limit': SEARCH_LIMIT}
+        with metrics.timer('http', 'giphy.search'):
+            async with self.bot.session.get(f'{GIPHY_API}/v1/gifs/search', params = params) as response:
+                response.raise_for_status()
+                data = await response.json(content_type = None)
+
+        try:
+            return [gif['images']['original']['url'] for gif in data['data']]
+        except (KeyError, TypeError):
+            raise ValueError(f"Unexpected Giphy payload for '{query}'.")
+
+    async def search_gifs(self, query: str):
+        """
+        Searches Giphy through its circuit breaker and caches the resulting GIF URLs for the query.
+
+        :rtype: list
+        :param query: The search terms
+        :raises: aiohttp.ClientError, asyncio.TimeoutError, ValueError, CircuitOpen
+        """
+        urls = await self.giphy.call(self._search, query)
+        self.gifs.set(query, urls)
+        if urls:
+            self._stale[query] = urls
+        return urls
+
+    async def gif(self, query: str):
+        """
+        Returns a random GIF URL for the query, searching Giphy only if the pool for it is cold.
+        If Giphy fails, is unhealthy or takes longer than COMMAND_BUDGET, the last good results are
+        used instead, and None is returned if there are none.
+
+        :rtype: str
+        :param query: The search terms
+        """
+        urls = self.gifs.get(query)
+        if urls is None:
+            try:
+                # The search is shielded by SingleFlight, so running out of budget leaves it running
+                # to fill the cache for the next command, without starting another one.
+                urls = await asyncio.wait_for(self._searches.do(query, self.search_gifs, query), COMMAND_BUDGET)
+            except SEARCH_ERRORS as e:
+                self.logger.warning(f"Giphy search for '{query}' failed, falling back || {type(e)}: {e}")
+                urls = self._stale.get(query)
+        return random.choice(urls) if urls else None
+
+    async def prefetch_gifs(self):
+        """Keeps a warm pool of GIFs for every command's query, refreshed before the cache expires."""
+        await self.bot.wait_until_ready()
+
+        while not self.bot.is_closed():
+            for query in QUERIES.values():
+                try:
+                    await self._searches.do(query, self.search_gifs, query)
+                except SEARCH_ERRORS:
+                    self.logger.exception(f"Prefetching GIFs for '{query}' failed.")
+            await asyncio.sleep(REFRESH_INTERVAL)
 
     @commands.command()
     async def hug(self, ctx, *, member: discord.Member = None):
         """Hug someone on the server <3"""
         embed = discord.Embed(color = 0xFFC0CB)
-        session = aiohttp.ClientSession()
-        response = await session.get(
-            'http://api.giphy.com/v1/gifs/search?q=manga+hug&api_key=NLUaerigtVW04pj4P4slXZOexvpC5VN3&limit=10')
-        data = json.loads(await response.text())
-        embed.set_image(url = data['data'][1]['images']['original']['url'])
+        url = await self.gif(QUERIES['hug'])
+        if url is not None:
+            embed.set_image(url = url)
 
         if member is None:
             embed.description = f"{ctx.message.author.mention} has been hugged by me!"
@@ -29,30 +114,25 @@ class CuteCog:
             else:
                 embed.description = f"{member.mention} just got a hug from me!"
 
-        await session.close()
-
         await ctx.send(embed = embed)
 
     @commands.command()
     async def wave(self, ctx):
         embed = discord.Embed(color = 0xFFC0CB)
-        session = aiohttp.ClientSession()
-        response = await session.get(
-            'http://api.giphy.com/v1/gifs/search?q=kawaii+wave&api_key=NLUaerigtVW04pj4P4slXZOexvpC5VN3&limit=1')
-        data = json.loads(await response.text())
-        embed.set_image(url = data['data'][0]['images']['original']['url'])
-        await session.close()
+        url = await self.gif(QUERIES['wave'])
+        if url is not None:
+            embed.set_image(url = url)
+        else:
+            embed.description = f"{ctx.message.author.mention} waves! \N{WAVING HAND SIGN}"
 
         await ctx.send(embed = embed)
 
     @commands.command(aliases = ['pat'])
     async def headpat(self, ctx, *, member: discord.Member = None):
         embed = discord.Embed(color = 0xFFC0CB)
-        session = aiohttp.ClientSession()
-        response = await session.get(
-            'http://api.giphy.com/v1/gifs/search?q=headpat+anime&api_key=NLUaerigtVW04pj4P4slXZOexvpC5VN3&limit=1')
-        data = json.loads(await response.text())
-        embed.set_image(url = data['data'][0]['images']['original']['url'])
+        url = await self.gif(QUERIES['headpat'])
+        if url is not None:
+            embed.set_image(url = url)
 
         if member is None:
             embed.description = f"{ctx.message.author.mention} patted my head! <3"
@@ -64,8 +144,6 @@ class CuteCog:
             else:
                 embed.description = f"{member.mention} just got a head pat from me!"
 
-        await session.close()
-
         await ctx.send(embed = embed)
 
 
@@ -1,7 +1,8 @@
 import discord
 from discord.ext import commands
 from .utils.settings import settings
-from .utils import checks
+from .utils import checks, loader, memory
+from .utils.metrics import metrics
 
 
 class MamaCog:
@@ -11,13 +12,123 @@ class MamaCog:
     @checks.is_guardian()
     @commands.command(name = 'changePlaying', aliases = ['playing'])
     async def change_playing(self, ctx, *game):
-        if ctx.message.author.id in settings.guardians:
-            game = ' '.join(game)
-            settings.bot_settings['currActivity'] = game
-            settings.save_bot_settings()
-            await self.bot.change_presence(activity = discord.Game(name = game))
+        game = ' '.join(game)
+        settings.set_activity(game)
+        await self.bot.change_presence(activity = discord.Game(name = game))
+        if self.bot.ipc is not None:
+            self.bot.ipc.broadcast('activity', name = game)
+
+    @checks.is_guardian()
+    @commands.command(name = 'reloadTalker', aliases = ['reloadtalker'])
+    async def reload_talker(self, ctx):
+        """Reloads TalkerCog's conversation files without restarting."""
+        talker = self.bot.get_cog('TalkerCog')
+        if talker is None:
+            await ctx.send("TalkerCog isn't loaded.")
+            return
+
+        # Imported here so MamaCog doesn't depend on TalkerCog being enabled.
+        from .talkercog import RELOAD_ERRORS
+
+        try:
+            await talker.reload_conversation(force = True)
+        except RELOAD_ERRORS as e:
+            await ctx.send(f"Reload failed, keeping the old responses || {type(e)}: {e}")
+        else:
+            await ctx.send(f"Reloaded {len(talker.index.matcher.rules)} responses.")
+
+    async def swap_cog(self, ctx, action: str, cog: str):
+        """Loads, unloads or reloads a cog in this bot and every other cluster worker, and reports how it went."""
+        cog = cog.lower()
+        if cog not in settings.extensions:
+            await ctx.send(f"There's no cog called {cog}.")
+            return
+
+        try:
+            if action == 'unload':
+                took = loader.unload(self.bot, cog)
+            elif action == 'reload':
+                took = await loader.reload(self.bot, cog)
+            else:
+                took = await loader.load(self.bot, cog)
+        except Exception as e:
+            kept = "kept the old version" if action == 'reload' else "nothing changed"
+            await ctx.send(f"Failed to {action} {cog}, {kept} || {type(e).__name__}: {e}")
+            return
+
+        if action == 'load':
+            settings.enable_extension(cog)
+        elif action == 'unload':
+            settings.disable_extension(cog)
+        if self.bot.ipc is not None:
+            self.bot.ipc.broadcast('extension', name = cog, action = action)
+        await ctx.send(f"{action.capitalize()}ed {cog} in {took * 1000:.1f} ms.")
+
+    @checks.is_guardian()
+    @commands.command(name = 'load')
+    async def load_cog(self, ctx, cog: str):
+        """Loads a cog and enables it for future boots."""
+        await self.swap_cog(ctx, 'load', cog)
+
+    @checks.is_guardian()
+    @commands.command(name = 'unload')
+    async def unload_cog(self, ctx, cog: str):
+        """Unloads a cog and disables it for future boots."""
+        if cog.lower() == 'mamacog':
+            await ctx.send("MamaCog can't unload itself, reload it instead.")
+            return
+        await self.swap_cog(ctx, 'unload', cog)
+
+    @checks.is_guardian()
+    @commands.command(name = 'reload')
+    async def reload_cog(self, ctx, cog: str):
+        """Replaces a loaded cog with its current code, keeping the old one if the new one fails."""
+        await self.swap_cog(ctx, 'reload', cog)
+
+    @checks.is_guardian()
+    @commands.command(name = 'stats')
+    async def stats(self, ctx, kind: str = 'command', top: int = 15):
+        """Shows the busiest commands, listeners or http calls by total time, with recent latencies."""
+        def ms(seconds):
+            return '-' if seconds is None else f"{seconds * 1000:.1f}"
+
+        rows = metrics.summaries(kind)[:top]
+        if not rows:
+            await ctx.send(f"No {kind} metrics yet. Try command, listener or http.")
+            return
+
+        width = max(len(row['name']) for row in rows)
+        lines = [f"{'name':<{width}} {'count':>7} {'errors':>6} {'total s':>8} {'p50':>7} {'p95':>7} {'p99':>7}"]
+        lines += [f"{row['name']:<{width}} {row['count']:>7} {row['errors']:>6} {row['total']:>8.1f} "
+                  f"{ms(row['p50']):>7} {ms(row['p95']):>7} {ms(row['p99']):>7}" for row in rows]
+        await ctx.send("```\n" + '\n'.join(lines) + "\n```")
+
+    @checks.is_guardian()
+    @commands.command(name = 'memory')
+    async def memory_report(self, ctx):
+        """Shows this process' memory use and how many objects each cache holds."""
+        rss = memory.process_rss()
+        counts = memory.cache_counts(self.bot)
+        width = max(len(name) for name in counts)
+        lines = [f"RSS: {'unknown' if rss is None else f'{rss / 2 ** 20:.1f} MiB'} "
+                 f"(profile {settings.memory_config.get('profile', 'default')})"]
+        lines += [f"{name:<{width}} {count:>9}" for name, count in counts.items()]
+        await ctx.send("```\n" + '\n'.join(lines) + "\n```")
+
+    @checks.is_guardian()
+    @commands.command(name = 'shards')
+    async def shards(self, ctx):
+        """Shows each shard's latency, guild count and gateway event rate, across the whole cluster."""
+        if self.bot.ipc is not None:
+            rows = self.bot.ipc.shard_report()
         else:
-            await ctx.send("No!")
+            rows = self.bot.shard_stats.report(self.bot)
+        rows = [f"{row['shard']:>5} {row['guilds']:>7} "
+                f"{'-' if row['latency'] is None else round(row['latency'] * 1000):>8} "
+                f"{row['rate']:>9.1f} {row['events']:>10}"
+                for row in rows]
+        header = f"{'shard':>5} {'guilds':>7} {'ping ms':>8} {'events/s':>9} {'events':>10}"
+        await ctx.send("```\n" + '\n'.join([header] + rows) + "\n```")
 
 
 def setup(bot):
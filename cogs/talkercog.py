@@ -1,9 +1,22 @@
-import random
-from copy import deepcopy
+import asyncio
+import logging
+import os
+import re
 from .utils.dataIO import dataIO
-from .utils.text_formatter import txt_frmt
+from .utils.matcher import ConversationIndex, ResponseMatcher
+from .utils.settings import settings
+from .utils import snapshot
 from discord.ext import commands
 
+RESPONSES = 'conversation/responses.json'
+PERSONALIZED = 'conversation/personalized.json'
+
+# How often, in seconds, the conversation files are checked for changes.
+WATCH_INTERVAL = 5
+
+# Errors that mean the conversation files on disk are unusable, in which case the old index is kept.
+RELOAD_ERRORS = (FileNotFoundError, ValueError, TypeError, KeyError, re.error)
+
 
 class TalkerCog:
     """
@@ -13,34 +26,108 @@ class TalkerCog:
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.logger = logging.getLogger("maneki")
+
+        # The compiled index is snapshotted, so restarts skip recompiling unchanged files.
+        self._stamp = self.conversation_stamp()
+        self.index = snapshot.load('conversation', self._stamp, self.build_index)
+
+        self._reload_lock = asyncio.Lock()
+        self._watcher = self.bot.loop.create_task(self.watch_conversation())
+
+    def __unload(self):
+        self._watcher.cancel()
+
+    @staticmethod
+    def build_index(responses: dict = None, personalized: dict = None):
+        """
+        Compiles both conversation files, loading whichever isn't given.
+
+        :rtype: ConversationIndex
+        :raises: FileNotFoundError, ValueError, TypeError, KeyError, re.error
+        """
+        if responses is None:
+            responses = dataIO.load_json(RESPONSES, copy = False)
+        if personalized is None:
+            personalized = settings.storage.load_json(PERSONALIZED, copy = False)
+
+        if responses is None or personalized is None:
+            raise ValueError("Conversation files could not be parsed.")
+
+        return ConversationIndex(responses, personalized)
 
-        self.responses = dataIO.load_json('conversation/responses.json')
-        self.personalized = dataIO.load_json('conversation/personalized.json')
+    def _rebuild(self, stamp, responses: dict, personalized: dict):
+        index = self.build_index(responses, personalized)
+        snapshot.save('conversation', stamp, index)
+        return index
 
     @staticmethod
-    def check_response(message, responses):
-        """Loops through the responses dict and returns the first valid response."""
-        for resp in responses.values():
-            if txt_frmt.regscan(message.content, resp['settings']['regex'],
-                                clean_str = bool('clean' not in resp['settings'])):
-                return {'response': random.choice(resp['responses'])}
-        return None
+    def conversation_stamp():
+        """Returns values that change whenever either conversation file does, None for a missing file."""
+        try:
+            stat = os.stat(os.path.join(dataIO.path, RESPONSES))
+            responses = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            responses = None
+        return responses, settings.storage.stamp(PERSONALIZED)
+
+    async def reload_conversation(self, *, force: bool = False):
+        """
+        Rebuilds the index in a worker thread if either conversation file changed, then swaps it in.
+        on_message keeps using the old index until the new one is complete.
+
+        :rtype: bool
+        :param force: Rebuild even if the files look unchanged
+        :return: If the index was replaced
+        :raises: FileNotFoundError, ValueError, TypeError, KeyError, re.error
+        """
+        async with self._reload_lock:
+            stamp = self.conversation_stamp()
+            if not force and stamp == self._stamp:
+                return False
+
+            # Stamped before reading, so a write landing mid-build is picked up by the next check.
+            responses, personalized = await asyncio.gather(
+                dataIO.load_json_async(RESPONSES, copy = False),
+                settings.storage.load_json_async(PERSONALIZED, copy = False))
+            if responses is None or personalized is None:
+                raise ValueError("Conversation files could not be parsed.")
+
+            self.index = await self.bot.loop.run_in_executor(None, self._rebuild, stamp, responses, personalized)
+            self._stamp = stamp
+
+        self.logger.info(f"Reloaded conversation files ({len(self.index.matcher.rules)} responses).")
+        return True
+
+    async def watch_conversation(self):
+        while not self.bot.is_closed():
+            await asyncio.sleep(WATCH_INTERVAL)
+            try:
+                await self.reload_conversation()
+            except RELOAD_ERRORS:
+                self._stamp = self.conversation_stamp()  # Don't retry until the files change again.
+                self.logger.exception("Conversation files failed to reload, keeping the old responses.")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Anything else may be transient, so it's retried on the next check. The watcher must not die.
+                self.logger.exception("Conversation files failed to reload unexpectedly, retrying on the next check.")
+
+    @staticmethod
+    def check_response(message, matcher: ResponseMatcher):
+        """Checks the message against the compiled responses and returns the first valid response."""
+        return matcher.check(message.content)
 
     async def on_message(self, message):
         if message.content.startswith("!!") or message.author == self.bot.user:
             return
 
-        responses = deepcopy(self.responses)
-        personalized = deepcopy(self.personalized)
-
-        # Personalized response checker.
-        if str(message.author.id) in self.personalized:
-            if "ignored" in self.personalized[str(message.author.id)]:
-                return
-
-            dataIO.merge(responses, personalized[str(message.author.id)])
+        # Personalized users get their own view of the responses, ignored users get none.
+        matcher = self.index.for_user(message.author.id)
+        if matcher is None:
+            return
 
-        response = self.check_response(message, responses)
+        response = self.check_response(message, matcher)
 
         if response is not None:
             await message.channel.send(response['response'])
@@ -0,0 +1,58 @@
+"""
+Timings of Maneki's boot, from the first import to the first READY. maneki.py imports this module
+first, so times are measured from about when the process started running Maneki's code.
+"""
+import json
+import time
+from contextlib import contextmanager
+
+_started = time.perf_counter()
+
+
+class BootReport:
+    def __init__(self):
+        self.phases = {}  # phase name -> seconds it took
+        self.marks = {}  # milestone name -> seconds since boot started
+        self.cogs = {}  # extension name -> {'imported': seconds, 'setup': seconds} or {'lazy_commands': count}
+
+    @contextmanager
+    def phase(self, name: str):
+        """Times the body of the with block as the named phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    def mark(self, name: str):
+        """Records that a milestone was reached now."""
+        self.marks[name] = time.perf_counter() - _started
+
+    def cog(self, extension: str, **timings):
+        self.cogs.setdefault(extension, {}).update(timings)
+
+    def as_dict(self):
+        """
+        :rtype: dict
+        """
+        def ms(seconds):
+            return round(seconds * 1000, 1) if isinstance(seconds, float) else seconds
+
+        return {'marks_ms': {name: ms(at) for name, at in self.marks.items()},
+                'phases_ms': {name: ms(took) for name, took in self.phases.items()},
+                'cogs_ms': {cog: {key: ms(value) for key, value in timings.items()}
+                            for cog, timings in self.cogs.items()}}
+
+    def log(self, logger):
+        """Logs the report as one line of json, and a readable summary of it."""
+        report = self.as_dict()
+        logger.info("Boot report " + json.dumps(report, sort_keys = True))
+
+        lines = [f"\t{name:<12} at {at:>9.1f} ms" for name, at in report['marks_ms'].items()]
+        lines += [f"\t{name:<12} took {took:>7.1f} ms" for name, took in report['phases_ms'].items()]
+        for cog, timings in report['cogs_ms'].items():
+            lines.append(f"\t{cog:<12} " + ', '.join(f"{key} {value}" for key, value in timings.items()))
+        print("Boot timings:\n" + '\n'.join(lines) + "\n")
+
+
+boot = BootReport()
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+    pass
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcome of recent calls to an external provider and fails fast while it is unhealthy.
+
+    Calls that raise or take longer than slow_call seconds count as failures. Once at least min_calls
+    of the last window calls are recorded and the failure rate reaches failure_rate, the breaker
+    opens and every call raises CircuitOpen for reset_timeout seconds. After that a single trial
+    call is let through (half-open): success closes the breaker, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name: str, *, window: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_call: float = 2.0, reset_timeout: float = 30):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.reset_timeout = reset_timeout
+
+        self.logger = logging.getLogger("maneki")
+        self._outcomes = deque(maxlen = window)  # True for each healthy call
+        self._opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    @property
+    def error_rate(self):
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def allow(self):
+        """Returns True if a call may be made now. In half-open state only one trial is allowed at once."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def record(self, success: bool, elapsed: float = 0.0):
+        """Records the outcome of a call made after allow() returned True."""
+        healthy = success and elapsed < self.slow_call
+        was_trial, self._trial = self._trial, False
+
+        if was_trial:
+            if healthy:
+                self._outcomes.clear()
+                self._opened_at = None
+                self.logger.info(f"Circuit for {self.name} closed.")
+            else:
+                self._opened_at = time.monotonic()
+            return
+
+        self._outcomes.append(healthy)
+        if (self._opened_at is None and len(self._outcomes) >= self.min_calls
+                and self.error_rate >= self.failure_rate):
+            self._opened_at = time.monotonic()
+            self.logger.warning(f"Circuit for {self.name} opened ({self.error_rate:.0%} of recent calls failed).")
+
+    async def call(self, func, *args, **kwargs):
+        """
+        Awaits func(*args, **kwargs) through the breaker.
+
+        :raises: CircuitOpen if the provider is considered unhealthy, or whatever func raises
+        """
+        if not self.allow():
+            raise CircuitOpen(self.name)
+
+        start = time.monotonic()
+        try:
+            result = await func(*args, **kwargs)
+        except (Exception, asyncio.CancelledError):
+            self.record(False, time.monotonic() - start)
+            raise
+        self.record(True, time.monotonic() - start)
+        return result
+
+
+_breakers = {}
+
+
+def breaker(name: str, **kwargs):
+    """
+    Returns the circuit breaker for a provider, creating it with kwargs on first use, so every cog
+    calling the same provider shares one view of its health.
+
+    :rtype: CircuitBreaker
+    """
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name, **kwargs)
+    return _breakers[name]
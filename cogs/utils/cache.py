@@ -0,0 +1,78 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    A size-bounded mapping that drops its least recently used entry when full, and whose entries
+    also expire a fixed number of seconds after they were set.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = 600):
+        """
+        :param maxsize: Most entries held at once
+        :param ttl: Seconds an entry lives after being set
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expiry, value), least recently used first
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key, default = None):
+        """
+        Returns the value for key if it is present and hasn't expired, otherwise default.
+        A hit marks the entry as recently used.
+        """
+        try:
+            expiry, value = self._data[key]
+        except KeyError:
+            return default
+
+        if expiry <= time.monotonic():
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        """
+        Stores value under key, evicting the least recently used entry if the cache is full.
+
+        :param ttl: Seconds this entry lives, instead of the cache's ttl
+        """
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last = False)
+
+    def pop(self, key, default = None):
+        """Removes key and returns its value if it was present and unexpired, otherwise default."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            return default
+        del self._data[key]
+        return value
+
+    def pop_where(self, predicate):
+        """Removes every entry whose key the predicate returns True for."""
+        for key in [key for key in self._data if predicate(key)]:
+            del self._data[key]
+
+    def expire(self):
+        """Drops every expired entry."""
+        now = time.monotonic()
+        for key in [key for key, (expiry, _) in self._data.items() if expiry <= now]:
+            del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+
+_MISSING = object()
@@ -1,10 +1,24 @@
-from .settings import settings
 from discord.ext import commands
+from .permissions import permissions
 
 
 def check_is_guardian(ctx):
-    return ctx.message.author.id in settings.guardians
+    return permissions.is_guardian(ctx.message.author)
+
+
+def check_is_admin(ctx):
+    return permissions.is_admin(ctx.message.author)
+
+
+def check_command_allowed(ctx):
+    """Global check applying the per-command allow and deny lists from botSettings.json."""
+    return permissions.command_allowed(ctx.message.author, ctx.command.qualified_name)
 
 
 def is_guardian():
     return commands.check(check_is_guardian)
+
+
+def is_admin():
+    """Passes for guardians and for members holding one of the guild's admin roles."""
+    return commands.check(check_is_admin)
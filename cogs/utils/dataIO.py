@@ -1,34 +1,131 @@
+import asyncio
+import atexit
 import json
 import logging
 import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from os.path import splitext, join
 from random import randint
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _loads(raw: bytes):
+    """Parses json with orjson when it's installed, otherwise the standard library."""
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def _dumps(data) -> bytes:
+    """Serializes json, indented by 2, with orjson when it's installed, otherwise the standard library."""
+    if orjson is not None:
+        return orjson.dumps(data, option = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, indent = 2).encode('utf-8')
+
 
 class DataIO:
+    MAX_WORKERS = 4  # threads for the async variants
 
     def __init__(self):
         self.logger = logging.getLogger("cueball")
         self.path = "data"
 
-    def load_json(self, file: str):
+        self._file_locks = defaultdict(threading.Lock)  # path -> lock held while the file is written
+        self._writer = WriteBehind(self)
+        self._executor = None
+
+        self._cache = {}  # path -> ((mtime, size), parsed json)
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    # Async variants, for use from cogs. They run the blocking calls below in a small thread pool
+    # so a slow disk doesn't hold up the event loop. Startup code can keep using the sync calls.
+
+    async def run_in_pool(self, func, *args):
+        """Awaits func(*args) in DataIO's thread pool. For other blocking storage work, like SQLite."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers = self.MAX_WORKERS, thread_name_prefix = "dataIO")
+        return await asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
+    async def load_json_async(self, file: str, *, copy: bool = True):
+        """Awaitable load_json, run in DataIO's thread pool."""
+        return await self.run_in_pool(partial(self.load_json, file, copy = copy))
+
+    async def dump_json_async(self, file: str, data: dict):
+        """Awaitable dump_json, run in DataIO's thread pool."""
+        return await self.run_in_pool(self.dump_json, file, data)
+
+    async def is_valid_json_async(self, file: str):
+        """Awaitable is_valid_json, run in DataIO's thread pool."""
+        return await self.run_in_pool(self.is_valid_json, file)
+
+    def load_json(self, file: str, *, copy: bool = True):
         """
-        Loads a json file.
+        Loads a json file. With copy=False, parsed files are cached in memory until their modification
+        time or size changes, so loading an unchanged file again only costs a stat.
 
         :param file: The json file to be loaded
-        :return: dict of loaded json
+        :param copy: If False, the cached object itself is returned. It isn't protected against
+            changes, but it's shared with every other copy=False caller until the file changes, so
+            callers must not change it. If True, the file is parsed again and the caller gets its
+            own object to change, without going through the cache.
+        :return: dict of loaded json, or None if the file isn't valid json
         :rtype: dict
+        :raises: FileNotFoundError
         """
         file = join(self.path, file) if self.path not in file else file
 
-        if self.is_valid_json(file):
-            try:
-                with open(file, mode = 'r') as file:
-                    return json.load(file)
-            except json.decoder.JSONDecodeError:
-                self.logger.error(f"Error while attempting to load {file}")
-        else:
-            raise FileNotFoundError
+        if copy:
+            return self._read_json(file)
+
+        stat = os.stat(file)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        with self._cache_lock:
+            cached = self._cache.get(file)
+            if cached is not None and cached[0] == stamp:
+                self.cache_hits += 1
+                return cached[1]
+            self.cache_misses += 1
+
+        data = self._read_json(file)
+        if data is not None:
+            with self._cache_lock:
+                self._cache[file] = (stamp, data)
+        return data
+
+    def _read_json(self, file: str):
+        try:
+            with open(file, mode = 'rb') as fp:
+                return _loads(fp.read())
+        except json.decoder.JSONDecodeError:
+            self.logger.error(f"Error while attempting to load {file}")
+            return None
+
+    def cache_info(self):
+        """
+        Returns load_json's cache statistics.
+
+        :rtype: dict
+        """
+        with self._cache_lock:
+            return {'hits': self.cache_hits, 'misses': self.cache_misses, 'files': len(self._cache)}
+
+    def exists(self, file: str):
+        """
+        Checks if the file exists, without reading it.
+
+        :rtype: bool
+        """
+        file = join(self.path, file) if self.path not in file else file
+        return os.path.isfile(file)
 
     def dump_json(self, file: str, data: dict):
         """
@@ -39,38 +136,61 @@ class DataIO:
         """
         file = join(self.path, file) if self.path not in file else file
 
+        # Serialized up front so the check below reads from memory rather than back from disk.
+        text = _dumps(data)
+
         path, ext = splitext(file)
         tmp_file = f"{path}-{randint(1000, 9999)}.tmp"
-        self._jdump(tmp_file, data)
-        try:
-            self.load_json(tmp_file)
-            os.replace(tmp_file, file)
-        except json.decoder.JSONDecodeError:
-            self.logger.exception(f"Save to {file} aborted due to error. Data can be found in {tmp_file}.")
+        with self._file_locks[file]:
+            self._jdump(tmp_file, text)
+            try:
+                parsed = _loads(text)
+                os.replace(tmp_file, file)
+            except json.decoder.JSONDecodeError:
+                self.logger.exception(f"Save to {file} aborted due to error. Data can be found in {tmp_file}.")
+                return
+
+            # What was just written is what the next load would parse, so cache it now.
+            stat = os.stat(file)
+            with self._cache_lock:
+                self._cache[file] = ((stat.st_mtime_ns, stat.st_size), parsed)
 
-    def _jdump(self, file, data):
+    def dump_json_later(self, file: str, data: dict):
+        """
+        Marks a json file as dirty and returns immediately. It is saved with dump_json from a worker
+        thread once updates to it stop for a moment, so a burst of changes costs a single write.
+        data is serialized when it is written, not when this is called, so keep passing the same
+        object and mutate it as usual.
+
+        :param file: The file where the data is to be dumped
+        :param data: The dictionary to dump into a JSON file
+        """
         file = join(self.path, file) if self.path not in file else file
-        with open(file, 'w') as file:
-            json.dump(data, file, indent = 2)
-        return data
+        self._writer.mark(file, data)
+
+    def flush(self):
+        """Saves every file marked by dump_json_later right away. Called on shutdown."""
+        self._writer.flush()
+
+    def _jdump(self, file, text: bytes):
+        file = join(self.path, file) if self.path not in file else file
+        with open(file, 'wb') as file:
+            file.write(text)
+        return text
 
     def is_valid_json(self, file: str):
         """
-        Checks if the file exists.
+        Checks if the file exists and is valid json. The parsed file is cached for load_json,
+        so use exists() when the contents aren't needed.
 
         :param file: The path of the file to be checked
         :return: If the file exists in the data folder
         :rtype: bool
         """
-        file = join(self.path, file) if self.path not in file else file
-
         try:
-            json.load(open(file, mode = 'r'))
-            return True
+            return self.load_json(file, copy = False) is not None
         except FileNotFoundError:
             return False
-        except json.decoder.JSONDecodeError:
-            return False
 
     def merge(self, a, b):
         """
@@ -92,5 +212,112 @@ class DataIO:
         else:
             raise TypeError
 
+    def merged(self, a, b):
+        """
+        Returns b merged over a without changing either. Values that b does not touch are shared
+        with a rather than copied.
+
+        :param a: dict being merged into
+        :param b: dict being merged from
+        :return: The merged dict
+        :rtype: dict
+        :raises: TypeError
+        """
+
+        if isinstance(a, dict) and isinstance(b, dict):
+            result = dict(a)
+            for key in b:
+                if isinstance(result.get(key), dict) and isinstance(b[key], dict):
+                    result[key] = self.merged(result[key], b[key])
+                else:
+                    result[key] = b[key]
+            return result
+        else:
+            raise TypeError
+
+
+class WriteBehind:
+    """
+    Debounced, coalescing saves for DataIO.dump_json_later. A worker thread writes each dirty file
+    DELAY seconds after its last update, or MAX_DELAY seconds after its first, whichever is sooner.
+    """
+
+    DELAY = 1.0
+    MAX_DELAY = 5.0
+    RETRIES = 3  # attempts to serialize data the event loop is changing at the same moment
+    FLUSH_TIMEOUT = 10.0  # seconds flush waits for the worker to finish the saves it already started
+
+    def __init__(self, io: DataIO):
+        self.io = io
+        self._pending = {}  # path -> (data, first marked, last marked)
+        self._in_flight = 0  # files taken from _pending by the worker and not yet written
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def mark(self, file: str, data: dict):
+        now = time.monotonic()
+        with self._cond:
+            first = self._pending[file][1] if file in self._pending else now
+            self._pending[file] = (data, first, now)
+
+            if self._thread is None:
+                self._thread = threading.Thread(target = self._run, name = "dataIO-writer", daemon = True)
+                self._thread.start()
+                atexit.register(self.flush)
+            self._cond.notify_all()
+
+    def _due(self, now: float):
+        """Returns the soonest deadline among pending files, and pops the files already due."""
+        due, soonest = [], None
+        for file, (data, first, last) in list(self._pending.items()):
+            deadline = min(last + self.DELAY, first + self.MAX_DELAY)
+            if deadline <= now:
+                due.append((file, data))
+                del self._pending[file]
+            elif soonest is None or deadline < soonest:
+                soonest = deadline
+        return due, soonest
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due, soonest = self._due(time.monotonic())
+                while not due:
+                    self._cond.wait(None if soonest is None else soonest - time.monotonic())
+                    due, soonest = self._due(time.monotonic())
+                self._in_flight += len(due)
+
+            for file, data in due:
+                try:
+                    self._write(file, data)  # logs its own errors, so the thread keeps running
+                finally:
+                    with self._cond:
+                        self._in_flight -= 1
+                        self._cond.notify_all()
+
+    def _write(self, file: str, data: dict):
+        for attempt in range(self.RETRIES):
+            try:
+                self.io.dump_json(file, data)
+                return
+            except RuntimeError:  # dict changed size during iteration
+                time.sleep(0.01)
+            except Exception:  # OSError, or data json can't hold, like a set. Other files still get saved.
+                self.io.logger.exception(f"Write-behind save to {file} failed.")
+                return
+        self.io.logger.error(f"Write-behind save to {file} abandoned, data kept changing while saving.")
+
+    def flush(self):
+        """
+        Writes every pending file now. The worker's own saves are waited for first, so an older
+        version of a file can't land on top of the one written here.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: not self._in_flight, self.FLUSH_TIMEOUT):
+                self.io.logger.error(f"Write-behind flush gave up waiting on {self._in_flight} saves in progress.")
+            pending, self._pending = self._pending, {}
+        for file, (data, first, last) in pending.items():
+            self._write(file, data)
+
 
 dataIO = DataIO()
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import os
+
+# Seconds between each worker's stats reports to the cluster supervisor.
+STATS_INTERVAL = 10
+
+
+class WorkerIPC:
+    """
+    A cluster worker's end of its pipe to the supervisor started by cluster.py.
+
+    Messages are dicts with an 'op' key. Whatever a worker broadcasts is relayed to every other
+    worker, where it is dispatched as a bot event named after the op, so cogs can listen for it:
+    broadcast('activity', name = "...") arrives as on_ipc_activity(data). The worker's shard stats
+    are sent every STATS_INTERVAL seconds, and the supervisor answers with everyone's, kept in
+    cluster_stats.
+    """
+
+    def __init__(self, bot, conn, cluster_id: int):
+        """
+        :param bot: The worker's Maneki instance
+        :param conn: multiprocessing Connection to the supervisor
+        :param cluster_id: Index of this worker in the cluster
+        """
+        self.bot = bot
+        self.conn = conn
+        self.cluster_id = cluster_id
+        self.cluster_stats = {}  # cluster id -> latest stats message from that worker
+        self.logger = logging.getLogger("maneki")
+        self._reporter = None
+
+    def start(self):
+        """Starts reading from the pipe and reporting stats on the bot's event loop."""
+        self.bot.loop.add_reader(self.conn.fileno(), self._on_readable)
+        self._reporter = self.bot.loop.create_task(self.report_stats())
+
+    def stop(self):
+        if self._reporter is not None:
+            self._reporter.cancel()
+        try:
+            self.bot.loop.remove_reader(self.conn.fileno())
+        except (OSError, ValueError):
+            pass  # already closed
+
+    def send(self, op: str, **data):
+        """Sends a message to the supervisor only."""
+        try:
+            self.conn.send({'op': op, 'cluster': self.cluster_id, **data})
+        except (OSError, EOFError):
+            self.logger.warning(f"Cluster supervisor is gone, dropped {op} message.")
+
+    def broadcast(self, op: str, **data):
+        """Sends a message to every other worker in the cluster."""
+        self.send('broadcast', event = op, data = data)
+
+    def _on_readable(self):
+        try:
+            while self.conn.poll():
+                message = self.conn.recv()
+                op = message.pop('op')
+                if op == 'cluster_stats':
+                    self.cluster_stats = message['workers']
+                elif op == 'broadcast':
+                    self.bot.dispatch(f"ipc_{message['event']}", message['data'])
+        except (OSError, EOFError):
+            self.logger.error("Lost the pipe to the cluster supervisor.")
+            self.stop()
+
+    def stats(self):
+        """
+        This worker's stats, as reported to the supervisor.
+
+        :rtype: dict
+        """
+        shards = self.bot.shard_stats.report(self.bot)
+        for row in shards:
+            row['cluster'] = self.cluster_id
+        return {'pid': os.getpid(), 'guilds': len(self.bot.guilds), 'shards': shards}
+
+    async def report_stats(self):
+        await self.bot.wait_until_ready()
+        while not self.bot.is_closed():
+            self.send('stats', **self.stats())
+            await asyncio.sleep(STATS_INTERVAL)
+
+    def shard_report(self):
+        """
+        Returns the rows of ShardStats.report for every shard in the cluster, with a 'cluster' key.
+        Other workers' rows are as of their last report.
+
+        :rtype: list
+        """
+        workers = {**self.cluster_stats, self.cluster_id: self.stats()}
+        return sorted((row for stats in workers.values() for row in stats['shards']),
+                      key = lambda row: row['shard'])
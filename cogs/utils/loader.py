@@ -0,0 +1,246 @@
+"""
+Faster cog loading for Maneki: parallel imports of the cogs loaded at boot, and lazy cogs that are
+only imported once one of their commands is first used.
+
+An extension is lazy when its botSettings.json entry has "lazy": true. Its commands are found by
+reading the cog's source without importing it, and stub commands with the same names and aliases
+are registered in their place. The first call to a stub loads the real cog and runs the message
+again. Cogs with event listeners can't wait for a command, so they're always loaded at boot, and so
+are cogs with a command name that clashes with one already registered.
+
+Stubs don't carry the real commands' checks, since those only exist once the cog is imported. Anyone
+can make a lazy cog load by using one of its commands, though the checks do apply when the message is
+run again through the real command.
+
+load, unload and reload swap cogs in a running bot, which MamaCog's guardian commands use.
+"""
+import ast
+import asyncio
+import importlib
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from discord.ext import commands
+
+# Threads importing cogs in parallel at boot.
+PRELOAD_WORKERS = 4
+
+_logger = logging.getLogger("maneki")
+
+
+def _timed_import(module: str):
+    start = time.perf_counter()
+    importlib.import_module(module)
+    return time.perf_counter() - start
+
+
+def preload(extensions):
+    """
+    Imports the extensions' modules in a thread pool, so their import times overlap. Running their
+    setup is left to load_extension, on the event loop's thread.
+
+    :return: {extension: Future of the seconds its import took, or of its import error}
+    :rtype: dict
+    """
+    with ThreadPoolExecutor(max_workers = PRELOAD_WORKERS, thread_name_prefix = 'preload') as pool:
+        return {extension: pool.submit(_timed_import, f"cogs.{extension}") for extension in extensions}
+
+
+def _decorator_command(decorator):
+    """Returns (name or None, aliases) if the decorator is @commands.command(...) or @commands.group(...)."""
+    call = decorator if isinstance(decorator, ast.Call) else None
+    func = call.func if call is not None else decorator
+    if not (isinstance(func, ast.Attribute) and func.attr in ('command', 'group') and
+            isinstance(func.value, ast.Name) and func.value.id == 'commands'):
+        return None
+
+    def string(node):
+        return node.value if isinstance(node, ast.Constant) and isinstance(node.value, str) else None
+
+    name, aliases = None, []
+    if call is not None:
+        if call.args and string(call.args[0]) is not None:
+            name = string(call.args[0])
+        for keyword in call.keywords:
+            if keyword.arg == 'name' and string(keyword.value) is not None:
+                name = string(keyword.value)
+            elif keyword.arg == 'aliases' and isinstance(keyword.value, (ast.List, ast.Tuple)):
+                aliases = [string(alias) for alias in keyword.value.elts if string(alias) is not None]
+    return name, aliases
+
+
+def discover(extension: str):
+    """
+    Reads a cog's source for its top-level commands and whether it listens for events.
+
+    :return: ([(command name, [aliases]), ...], whether it has listeners)
+    :rtype: tuple
+    """
+    with open(os.path.join('cogs', f"{extension}.py"), encoding = 'utf-8') as file:
+        tree = ast.parse(file.read())
+
+    found, listens = [], False
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            if node.name.startswith('on_'):
+                listens = True
+            for decorator in node.decorator_list:
+                command = _decorator_command(decorator)
+                if command is not None:
+                    found.append((command[0] or node.name, command[1]))
+        elif isinstance(node, ast.Attribute) and node.attr == 'add_listener':
+            listens = True
+    return found, listens
+
+
+class LazyExtension:
+    """Stub commands standing in for an extension until one of them is used."""
+
+    def __init__(self, bot, extension: str, found: list):
+        """
+        :param found: The extension's commands, as returned by discover
+        """
+        self.bot = bot
+        self.extension = extension
+        self.names = [name for name, _ in found]
+        self.stubs = [commands.Command(name, self._invoke, aliases = aliases)
+                      for name, aliases in found]
+        self.loaded = False
+        self._lock = asyncio.Lock()
+
+    def install(self):
+        """
+        Registers the stubs, or none of them if one clashes with a command that's already registered.
+
+        :raises: discord.ClientException
+        """
+        try:
+            for stub in self.stubs:
+                self.bot.add_command(stub)
+        except Exception:
+            self.uninstall()
+            raise
+
+    def uninstall(self):
+        for stub in self.stubs:
+            if self.bot.all_commands.get(stub.name) is stub:
+                self.bot.remove_command(stub.name)
+
+    async def load(self):
+        """Imports the extension off the event loop and swaps it in for the stubs."""
+        async with self._lock:
+            if self.loaded:
+                return
+
+            start = time.perf_counter()
+            await self.bot.loop.run_in_executor(None, importlib.import_module, f"cogs.{self.extension}")
+            self.uninstall()
+            try:
+                self.bot.load_extension(f"cogs.{self.extension}")
+            except Exception:
+                self.install()
+                raise
+            self.loaded = True
+            _logger.info(f"Loaded lazy extension {self.extension} in "
+                         f"{(time.perf_counter() - start) * 1000:.1f} ms.")
+
+    async def _invoke(self, ctx, *args):
+        await self.load()
+        await self.bot.process_commands(ctx.message)
+
+
+# Swapping cogs in a running bot
+
+async def _import(bot, module: str):
+    """Imports a fresh copy of the module off the event loop, leaving sys.modules as it was."""
+    previous = sys.modules.pop(module, None)
+    try:
+        return await bot.loop.run_in_executor(None, importlib.import_module, module)
+    finally:
+        if previous is not None:
+            sys.modules[module] = previous
+        else:
+            sys.modules.pop(module, None)
+
+
+def _discard(bot, module: str, lib):
+    """Removes whatever a failed setup managed to register, as unloading would."""
+    sys.modules[module] = lib
+    bot.extensions[module] = lib
+    bot.unload_extension(module)
+
+
+async def load(bot, extension: str):
+    """
+    Loads an extension into the running bot, importing it off the event loop.
+
+    :return: Seconds it took
+    :rtype: float
+    :raises: Whatever importing it or its setup raises
+    """
+    module = f"cogs.{extension}"
+    start = time.perf_counter()
+
+    stub = bot.lazy_extensions.pop(extension, None)
+    if stub is not None:
+        stub.uninstall()
+    if module in bot.extensions:
+        return time.perf_counter() - start
+
+    lib = await _import(bot, module)
+    sys.modules[module] = lib
+    try:
+        bot.load_extension(module)
+    except Exception:
+        _discard(bot, module, lib)
+        raise
+    return time.perf_counter() - start
+
+
+def unload(bot, extension: str):
+    """
+    Unloads an extension from the running bot, or drops its stubs if it's lazy and unused.
+
+    :return: Seconds it took
+    :rtype: float
+    """
+    start = time.perf_counter()
+    stub = bot.lazy_extensions.pop(extension, None)
+    if stub is not None:
+        stub.uninstall()
+    bot.unload_extension(f"cogs.{extension}")
+    return time.perf_counter() - start
+
+
+async def reload(bot, extension: str):
+    """
+    Replaces a loaded extension with a freshly imported copy. The new copy is imported before the old
+    one is unloaded, so its commands are only missing for the swap itself. If the new copy fails to
+    import, the old one is left in place; if its setup fails, the old one is set up again.
+
+    :return: Seconds it took
+    :rtype: float
+    :raises: Whatever importing the new copy or its setup raises
+    """
+    module = f"cogs.{extension}"
+    old = bot.extensions.get(module)
+    if old is None:
+        return await load(bot, extension)
+
+    start = time.perf_counter()
+    new = await _import(bot, module)
+
+    bot.unload_extension(module)
+    sys.modules[module] = new
+    try:
+        bot.load_extension(module)
+    except Exception:
+        _discard(bot, module, new)
+        sys.modules[module] = old
+        old.setup(bot)
+        bot.extensions[module] = old
+        raise
+    return time.perf_counter() - start
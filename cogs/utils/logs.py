@@ -0,0 +1,140 @@
+"""
+Logging helpers for set_logger. Records are put on a queue by the loggers and written out by a
+QueueListener thread, so file and console writes never block the event loop.
+"""
+import copy
+import json
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+TEXT_FORMAT = logging.Formatter('%(asctime)s %(levelname)s %(module)s %(funcName)s %(lineno)d: %(message)s',
+                                datefmt = "[%Y-%m-%d:%H:%M]")
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats each record as one line of json."""
+
+    def format(self, record):
+        entry = {'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'), 'level': record.levelname,
+                 'logger': record.name, 'module': record.module, 'function': record.funcName,
+                 'line': record.lineno, 'thread': record.threadName, 'message': record.getMessage()}
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text  # set by TracebackQueueHandler
+        return json.dumps(entry, ensure_ascii = False)
+
+
+class TracebackQueueHandler(QueueHandler):
+    """
+    QueueHandler that keeps a record's traceback as exc_text, where the stock one folds it into the
+    message. The handlers on the listener thread then format it themselves, so JSONFormatter can
+    put it in its exception field.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = TEXT_FORMAT.formatException(record.exc_info)
+        # Merged now, since the args may not pickle or may change before the listener gets to them.
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limits how often each line of code may log, per logger. A call site over its limit has its
+    records dropped, and the next record it gets through says how many were. Errors always pass.
+
+        RateLimitFilter({'discord.gateway': 1, 'maneki': 20})
+
+    allows one record per second from each line of discord.gateway (and its children) and twenty
+    from each line under maneki, with bursts of up to the same number.
+    """
+
+    def __init__(self, limits: dict):
+        """
+        :param limits: {logger name: records per second}, matched by longest prefix
+        """
+        super().__init__()
+        self.limits = limits
+        self._buckets = {}  # (logger name, path, line) -> [tokens, last refill, dropped]
+        self._lock = threading.Lock()
+
+    def _limit(self, name: str):
+        while name:
+            if name in self.limits:
+                return self.limits[name]
+            name = name.rpartition('.')[0]
+        return None
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR:
+            return True
+        rate = self._limit(record.name)
+        if rate is None:
+            return True
+
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [rate, now, 0]
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            dropped, bucket[2] = bucket[2], 0
+
+        if dropped:
+            record.msg = f"{record.getMessage()} ({dropped} similar records dropped)"
+            record.args = None
+        return True
+
+
+def rotating_file(filename: str, formatter: logging.Formatter):
+    handler = RotatingFileHandler(filename = filename, encoding = 'utf-8', mode = 'a',
+                                  maxBytes = 10 ** 7, backupCount = 3)
+    handler.setFormatter(formatter)
+    return handler
+
+
+def start_queue(loggers: list, handlers: list, limits: dict = None):
+    """
+    Routes the loggers' records through a queue to the handlers, which run on a listener thread.
+    Each handler still applies its own level and filters.
+
+    :param loggers: Loggers whose records are queued. Their existing handlers are removed
+    :param handlers: Handlers the listener thread writes with
+    :param limits: Rate limits for RateLimitFilter, applied before records are queued
+    :return: The started listener, to stop when shutting down
+    :rtype: QueueListener
+    """
+    records = queue.Queue(-1)
+    queue_handler = TracebackQueueHandler(records)
+    if limits:
+        queue_handler.addFilter(RateLimitFilter(limits))
+
+    for logger in loggers:
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        logger.addHandler(queue_handler)
+
+    listener = QueueListener(records, *handlers, respect_handler_level = True)
+    listener.start()
+    return listener
+
+
+def stop_queue(listener: QueueListener):
+    """Writes out the records still queued, stops the listener thread and closes its handlers."""
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
@@ -0,0 +1,208 @@
+import random
+import re
+
+from .dataIO import dataIO
+from .prefilter import KeywordAutomaton, required_literal
+from .text_formatter import txt_frmt
+
+
+class ResponseRule:
+    """A single conversation rule from responses.json with its regex compiled once."""
+
+    __slots__ = ('name', 'settings', 'patterns', 'literals', 'clean', 'responses')
+
+    def __init__(self, name: str, rule: dict, base: 'ResponseRule' = None):
+        """
+        :param name: The key of the rule in the conversation file
+        :param rule: The rule's dict, containing 'settings' and 'responses'
+        :param base: A rule whose compiled patterns are reused if it shares the same settings dict
+        :raises: TypeError, re.error
+        """
+        self.name = name
+        self.settings = rule['settings']
+        self.responses = rule['responses']
+
+        if base is not None and base.settings is self.settings:
+            self.patterns = base.patterns
+            self.literals = base.literals
+            self.clean = base.clean
+            return
+
+        regex = self.settings['regex']
+
+        if type(regex) == str:
+            regex = [regex]
+        elif type(regex) != list:
+            raise TypeError
+
+        self.patterns = tuple(re.compile(reg) for reg in regex)
+        self.clean = 'clean' not in self.settings
+
+        # One literal per pattern, any of which makes the rule worth searching. If a pattern has
+        # no required literal the rule can't be filtered out and is always searched.
+        literals = tuple(required_literal(pattern) for pattern in self.patterns)
+        self.literals = None if None in literals else literals
+
+    def search(self, string: str):
+        """
+        Returns True if any of the rule's patterns match the string.
+
+        :rtype: bool
+        :param string: The (already cleaned, if required) message content
+        """
+        for pattern in self.patterns:
+            if pattern.search(string) is not None:
+                return True
+        return False
+
+
+class ResponseMatcher:
+    """
+    Compiled form of a conversation file. Rules are checked in file order and the first match wins.
+
+    A keyword automaton built from the literal each pattern requires picks out the few rules that
+    could match a message, so only those are run through their regex. Rules without such a literal
+    are always run.
+
+    A matcher layered over another (see layer) reuses the other's automatons and builds small ones
+    for the rules it changes or adds, so a layer costs as much as its overrides, not the whole file.
+    """
+
+    def __init__(self, responses: dict, base: 'ResponseMatcher' = None):
+        """
+        :param responses: The loaded contents of a conversation file
+        :param base: A matcher whose compiled rules are reused for any rule dict it shares with responses
+        """
+        self.source = responses
+        self.rules = []
+
+        for name, rule in responses.items():
+            base_rule = None if base is None else base.rules_by_name.get(name)
+
+            if base_rule is not None and base.source[name] is rule:
+                self.rules.append(base_rule)
+            else:
+                self.rules.append(ResponseRule(name, rule, base_rule))
+
+        self.rules_by_name = {rule.name: rule for rule in self.rules}
+
+        # Each layer is (clean automaton, raw automaton, rules always run, rules it must not report).
+        if base is not None and len(base._layers) == 1 and self._extends(base):
+            changed = frozenset(index for index, rule in enumerate(self.rules)
+                                if index >= len(base.rules) or rule is not base.rules[index])
+            clean_filter, raw_filter, always, _ = base._layers[0]
+            self._layers = ((clean_filter, raw_filter, always, changed), self._prefilter(changed))
+        else:
+            self._layers = (self._prefilter(range(len(self.rules))),)
+
+    def _extends(self, base: 'ResponseMatcher'):
+        """Returns True if this matcher's rules start with base's rules, by name and in order."""
+        return (len(self.rules) >= len(base.rules) and
+                all(rule.name == base_rule.name for rule, base_rule in zip(self.rules, base.rules)))
+
+    def layer(self, overrides: dict):
+        """
+        Returns a matcher with the overrides on top of this one. Neither matcher's data is copied,
+        and only the rules the overrides touch are compiled again.
+
+        :rtype: ResponseMatcher
+        :param overrides: A user's entry from personalized.json
+        """
+        if not overrides:
+            return self
+        return ResponseMatcher(dataIO.merged(self.source, overrides), base = self)
+
+    def _prefilter(self, indexes):
+        """
+        Builds a layer for the rules at the given indexes: keyword automatons for the rules matching
+        against cleaned and raw text (None if no rule has literals), and the indexes of the rules
+        that have to be run on every message.
+        """
+        keywords = {True: {}, False: {}}
+        always = set()
+
+        for index in indexes:
+            rule = self.rules[index]
+            if rule.literals is None:
+                always.add(index)
+            else:
+                for literal in rule.literals:
+                    keywords[rule.clean].setdefault(literal, set()).add(index)
+
+        clean_filter, raw_filter = (KeywordAutomaton(keywords[clean]) if keywords[clean] else None
+                                    for clean in (True, False))
+        return clean_filter, raw_filter, frozenset(always), frozenset()
+
+    def match(self, content: str):
+        """
+        Returns the first rule matching the message content, or None.
+
+        :rtype: ResponseRule
+        :param content: The raw message content
+        """
+        cleaned = txt_frmt.clean(content)
+
+        candidates = set()
+        for clean_filter, raw_filter, always, shadowed in self._layers:
+            found = set(always)
+            if clean_filter is not None:
+                found |= clean_filter.search(cleaned)
+            if raw_filter is not None:
+                found |= raw_filter.search(content)
+            candidates |= found - shadowed if shadowed else found
+
+        for index in sorted(candidates):
+            rule = self.rules[index]
+            if rule.search(cleaned if rule.clean else content):
+                return rule
+        return None
+
+    def check(self, content: str):
+        """
+        Returns a random response from the first matching rule, or None.
+
+        :rtype: dict
+        :param content: The raw message content
+        """
+        rule = self.match(content)
+
+        if rule is None:
+            return None
+        return {'response': random.choice(rule.responses)}
+
+
+class ConversationIndex:
+    """
+    The shared matcher for a conversation file along with each personalized user's layered view of
+    it. Views are built on first use and live as long as the index, so a new index has to be built
+    whenever either file changes.
+    """
+
+    def __init__(self, responses: dict, personalized: dict):
+        """
+        :param responses: The loaded contents of responses.json
+        :param personalized: The loaded contents of personalized.json
+        """
+        self.matcher = ResponseMatcher(responses)
+        self.personalized = personalized
+        self._views = {}
+
+    def for_user(self, user_id):
+        """
+        Returns the matcher for a user, or None if the user is ignored.
+
+        :rtype: ResponseMatcher
+        :param user_id: ID of the message's author
+        """
+        key = str(user_id)
+        overrides = self.personalized.get(key)
+
+        if overrides is None:
+            return self.matcher
+
+        try:
+            return self._views[key]
+        except KeyError:
+            view = None if "ignored" in overrides else self.matcher.layer(overrides)
+            self._views[key] = view
+            return view
@@ -0,0 +1,89 @@
+"""
+Memory profiles for Maneki's discord.py client caches, and footprint reporting.
+
+The "memory" entry of botSettings.json picks a profile and can override its options:
+
+    "memory": {"profile": "lean", "max_messages": 500}
+
+max_messages is the size of the message cache (discord.py keeps at least 100). Edits, deletes and
+reactions on messages that fell out of it only reach the raw events. fetch_offline_members False
+stops discord.py from chunking large guilds at startup, so only online members are cached for
+them. This version of discord.py has no finer member cache policy than that.
+"""
+import os
+import sys
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from .dataIO import dataIO
+from .permissions import permissions
+
+PROFILES = {
+    'default': {},  # discord.py's own defaults: 5000 messages, every member of every guild
+    'lean': {'max_messages': 1000, 'fetch_offline_members': False},
+    'minimal': {'max_messages': 100, 'fetch_offline_members': False},
+}
+OPTIONS = ('max_messages', 'fetch_offline_members')
+
+
+def client_options(config: dict):
+    """
+    Returns the client keyword arguments for a "memory" entry of botSettings.json.
+
+    :rtype: dict
+    :raises: ValueError if the profile doesn't exist
+    """
+    profile = config.get('profile', 'default')
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown memory profile {profile}, pick one of {', '.join(PROFILES)}.")
+    options = dict(PROFILES[profile])
+    options.update((key, config[key]) for key in OPTIONS if key in config)
+    return options
+
+
+def process_rss():
+    """
+    Returns the process' resident set size in bytes, or None where it can't be read. Uses psutil
+    when it's installed, otherwise /proc, otherwise the peak RSS from getrusage.
+
+    :rtype: int
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def cache_counts(bot):
+    """
+    Counts the objects held by the client's caches and Maneki's own.
+
+    :rtype: dict
+    """
+    guilds = bot.guilds
+    state = bot._connection
+    return {
+        'guilds': len(guilds),
+        'channels': sum(len(guild.channels) for guild in guilds),
+        'roles': sum(len(guild.roles) for guild in guilds),
+        'members': sum(len(guild.members) for guild in guilds),
+        'users': len(bot.users),
+        'emojis': len(bot.emojis),
+        'private channels': len(bot.private_channels),
+        'messages': len(getattr(state, '_messages', ())),
+        'max messages': state.max_messages,
+        'permission grants': len(permissions),
+        'json files': dataIO.cache_info()['files'],
+    }
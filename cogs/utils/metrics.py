@@ -0,0 +1,170 @@
+"""
+Counts and latencies of Maneki's commands, event listeners and outbound HTTP calls.
+
+Each timed name keeps its totals since boot and its last WINDOW samples, so percentiles follow
+recent traffic and memory stays fixed however busy the bot gets. Snapshots can be exported as
+json or in Prometheus' text format.
+"""
+import json
+import os
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from random import randint
+
+from .dataIO import dataIO
+
+# Latency samples kept per timed name.
+WINDOW = 1024
+
+
+class Timer:
+    """Totals and a rolling window of latencies for one command, listener or HTTP call."""
+
+    __slots__ = ('count', 'errors', 'total', 'samples')
+
+    def __init__(self, window: int = WINDOW):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.samples = deque(maxlen = window)
+
+    def record(self, seconds: float, error: bool = False):
+        self.count += 1
+        self.total += seconds
+        self.samples.append(seconds)
+        if error:
+            self.errors += 1
+
+    def percentiles(self, *pcts):
+        """
+        Returns the given percentiles of the recent samples, in seconds, or None for each if there are none.
+
+        :rtype: list
+        """
+        ordered = sorted(self.samples)
+        if not ordered:
+            return [None for _ in pcts]
+        return [ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in pcts]
+
+    def summary(self):
+        """
+        :return: {'count', 'errors', 'total', 'p50', 'p95', 'p99'}, times in seconds
+        :rtype: dict
+        """
+        p50, p95, p99 = self.percentiles(50, 95, 99)
+        return {'count': self.count, 'errors': self.errors, 'total': self.total,
+                'p50': p50, 'p95': p95, 'p99': p99}
+
+
+class Metrics:
+    def __init__(self, window: int = WINDOW):
+        self.window = window
+        self.timers = {}  # (kind, name) -> Timer
+        self.counters = Counter()  # (kind, name) -> count, for events without a duration
+        self.started = time.time()
+
+    def record(self, kind: str, name: str, seconds: float, error: bool = False):
+        """
+        Records one timed call.
+
+        :param kind: What was timed, such as 'command', 'listener' or 'http'
+        :param name: The command, listener or endpoint
+        """
+        timer = self.timers.get((kind, name))
+        if timer is None:
+            timer = self.timers[(kind, name)] = Timer(self.window)
+        timer.record(seconds, error)
+
+    def count(self, kind: str, name: str, amount: int = 1):
+        self.counters[(kind, name)] += amount
+
+    @contextmanager
+    def timer(self, kind: str, name: str):
+        """Times the body of the with block, as an error if it raises. Works around awaits too."""
+        start = time.perf_counter()
+        error = True
+        try:
+            yield
+            error = False
+        finally:
+            self.record(kind, name, time.perf_counter() - start, error)
+
+    def summaries(self, kind: str):
+        """
+        Returns the summary of every name of a kind, busiest (by total time) first.
+
+        :rtype: list
+        """
+        rows = [{'name': name, **timer.summary()} for (k, name), timer in self.timers.items() if k == kind]
+        return sorted(rows, key = lambda row: row['total'], reverse = True)
+
+    def snapshot(self):
+        """
+        :return: {'started', 'timers': {kind: {name: summary}}, 'counters': {kind: {name: count}}}
+        :rtype: dict
+        """
+        timers, counters = {}, {}
+        for (kind, name), timer in list(self.timers.items()):
+            timers.setdefault(kind, {})[name] = timer.summary()
+        for (kind, name), count in list(self.counters.items()):
+            counters.setdefault(kind, {})[name] = count
+        return {'started': self.started, 'timers': timers, 'counters': counters}
+
+    def prometheus(self):
+        """
+        Returns the metrics in Prometheus' text exposition format, as summaries named
+        maneki_<kind>_seconds and counters named maneki_<kind>_total.
+
+        :rtype: str
+        """
+        def label(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        snapshot = self.snapshot()
+        lines = []
+        for kind, timers in sorted(snapshot['timers'].items()):
+            metric = f"maneki_{kind}_seconds"
+            lines += [f"# HELP {metric} Latency of each {kind}.", f"# TYPE {metric} summary"]
+            for name, summary in sorted(timers.items()):
+                for quantile in ('p50', 'p95', 'p99'):
+                    if summary[quantile] is not None:
+                        lines.append(f'{metric}{{name="{label(name)}",quantile="0.{quantile[1:]}"}} '
+                                     f'{summary[quantile]:.6f}')
+                lines.append(f'{metric}_sum{{name="{label(name)}"}} {summary["total"]:.6f}')
+                lines.append(f'{metric}_count{{name="{label(name)}"}} {summary["count"]}')
+            errors = f"maneki_{kind}_errors_total"
+            lines.append(f"# TYPE {errors} counter")
+            lines += [f'{errors}{{name="{label(name)}"}} {summary["errors"]}'
+                      for name, summary in sorted(timers.items())]
+        for kind, counts in sorted(snapshot['counters'].items()):
+            metric = f"maneki_{kind}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines += [f'{metric}{{name="{label(name)}"}} {count}' for name, count in sorted(counts.items())]
+        return '\n'.join(lines) + '\n'
+
+    def render(self, fmt: str = 'prometheus'):
+        """
+        :param fmt: 'prometheus' or 'json'
+        :rtype: str
+        """
+        return json.dumps(self.snapshot(), indent = 2) if fmt == 'json' else self.prometheus()
+
+    async def export(self, file: str, fmt: str = 'prometheus'):
+        """
+        Atomically writes the metrics to a file in the data folder. They're rendered on the event loop,
+        which is the only thread changing them, and written from DataIO's thread pool.
+
+        :param fmt: 'prometheus' or 'json'
+        """
+        await dataIO.run_in_pool(self._write, os.path.join(dataIO.path, file), self.render(fmt))
+
+    @staticmethod
+    def _write(path: str, text: str):
+        tmp_file = f"{os.path.splitext(path)[0]}-{os.getpid()}-{randint(1000, 9999)}.tmp"
+        with open(tmp_file, 'w', encoding = 'utf-8') as fp:
+            fp.write(text)
+        os.replace(tmp_file, path)
+
+
+metrics = Metrics()
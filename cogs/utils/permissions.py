@@ -0,0 +1,107 @@
+from .cache import TTLCache
+from .settings import settings
+
+
+class PermissionIndex:
+    """
+    Constant-time permission lookups, built from the "guardians" and "permissions" entries of
+    botSettings.json:
+
+        "permissions": {
+            "admin_roles": {"<guild id>": [<role id>, ...]},
+            "commands": {"<command name>": {"allow": [<user or role id>, ...], "deny": [...]}}
+        }
+
+    Guardians pass every check. Admins are members holding one of their guild's admin roles.
+    A command's deny list beats its allow list, and a command with an allow list is limited to it.
+
+    What each (user, guild) pair is allowed is cached, and the cache is dropped whenever Settings
+    rebuilds its views, or for a member or guild when Maneki sees their roles change.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 600):
+        self._rules = None
+        self._grants = TTLCache(maxsize = maxsize, ttl = ttl)  # (user id, guild id) -> Grant
+
+    def _current(self):
+        rules = settings.permissions
+        if rules is not self._rules:
+            self._rules = rules
+            self._grants.clear()
+        return rules
+
+    def grant(self, user):
+        """
+        Returns what a user or member is allowed, from the cache if possible.
+
+        :rtype: Grant
+        :param user: A discord.User or discord.Member
+        """
+        rules = self._current()
+        guild = getattr(user, 'guild', None)
+        key = (user.id, guild.id if guild is not None else None)
+
+        grant = self._grants.get(key)
+        if grant is None:
+            role_ids = frozenset(role.id for role in getattr(user, 'roles', ()))
+            guardian = user.id in settings.guardians
+            admin = guardian or (guild is not None and
+                                 not role_ids.isdisjoint(rules['admin_roles'].get(guild.id, ())))
+            grant = Grant(user.id, role_ids, guardian, admin)
+            self._grants.set(key, grant)
+        return grant
+
+    def is_guardian(self, user):
+        return user.id in settings.guardians
+
+    def is_admin(self, user):
+        return self.grant(user).admin
+
+    def command_allowed(self, user, command: str):
+        """
+        Checks a command's allow and deny lists against the user and their roles.
+
+        :rtype: bool
+        :param command: The command's qualified name
+        """
+        rules = self._current()
+        lists = rules['commands'].get(command)
+        if lists is None:
+            return True
+
+        grant = self.grant(user)
+        if grant.guardian:
+            return True
+
+        allow, deny = lists
+        if grant.user_id in deny or not grant.role_ids.isdisjoint(deny):
+            return False
+        return not allow or grant.user_id in allow or not grant.role_ids.isdisjoint(allow)
+
+    def __len__(self):
+        """Number of grants cached."""
+        return len(self._grants)
+
+    def invalidate(self, guild_id: int = None, user_id: int = None):
+        """Drops cached grants for a member, a whole guild, or everyone if neither is given."""
+        if guild_id is None and user_id is None:
+            self._grants.clear()
+        elif user_id is not None:
+            self._grants.pop((user_id, guild_id))
+        else:
+            self._grants.pop_where(lambda key: key[1] == guild_id)
+
+
+class Grant:
+    """What a user is allowed within one guild (or in DMs)."""
+
+    __slots__ = ('user_id', 'role_ids', 'guardian', 'admin')
+
+    def __init__(self, user_id: int, role_ids: frozenset, guardian: bool, admin: bool):
+        self.user_id = user_id
+        self.role_ids = role_ids
+        self.guardian = guardian
+        self.admin = admin
+
+
+permissions = PermissionIndex()
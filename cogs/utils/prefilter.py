@@ -0,0 +1,128 @@
+import re
+from collections import deque
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over a set of literal keywords. A single pass over a string reports every
+    keyword that occurs in it, no matter how many keywords the automaton holds.
+    """
+
+    def __init__(self, keywords: dict):
+        """
+        :param keywords: A dict of {keyword: iterable of values}, where the values are reported
+            by search() whenever the keyword is found
+        """
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [frozenset()]
+
+        for keyword, values in keywords.items():
+            state = 0
+            for char in keyword:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(frozenset())
+                state = nxt
+            self._out[state] = self._out[state] | frozenset(values)
+
+        # Breadth first, so every state's failure target is finished before the state itself.
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] = self._out[nxt] | self._out[self._fail[nxt]]
+
+    def __len__(self):
+        return len(self._goto) - 1
+
+    def search(self, string: str):
+        """
+        Returns the values of every keyword found in the string.
+
+        :rtype: set
+        :param string: The string to scan
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+
+        for char in string:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found |= out[state]
+
+        return found
+
+
+def required_literal(pattern):
+    """
+    Returns the longest literal that every match of the pattern has to contain, or None if the
+    pattern does not require one (or is case-insensitive, so no single literal would do).
+
+    Ex: 'h((a?i+)|(e(n|l)lo+)) (ma)?neki' -> 'neki'
+        'hi+'                             -> 'h'
+        '(hi|yo)'                         -> None
+
+    :rtype: str
+    :param pattern: A compiled regex
+    """
+
+    if pattern.flags & re.IGNORECASE:
+        return None
+
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except re.error:
+        return None
+
+    literals = _literals(parsed)
+    return max(literals, key = len) if literals else None
+
+
+def _literals(parsed):
+    """Returns the literal runs that must appear in anything the parsed (sub)pattern matches."""
+    literals = []
+    run = []
+
+    def flush():
+        if run:
+            literals.append(''.join(run))
+            run.clear()
+
+    for op, arg in parsed:
+        if op == sre_parse.LITERAL:
+            run.append(chr(arg))
+            continue
+
+        flush()
+
+        if op == sre_parse.SUBPATTERN:
+            add_flags, sub = arg[1], arg[-1]
+            if not add_flags & re.IGNORECASE:
+                literals.extend(_literals(sub))
+
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            low, sub = arg[0], arg[2]
+            if low >= 1:
+                literals.extend(_literals(sub))
+
+    flush()
+    return literals
@@ -1,15 +1,26 @@
 import platform
 
+from .boot import boot
 from .dataIO import dataIO
-from copy import deepcopy
+from .storage import open_storage
 from os import listdir
+from types import MappingProxyType
 
 
 class Settings:
     # TODO: Add documentation for all methods in Settings
 
     def __init__(self):
-        if not dataIO.is_valid_json("botSettings.json"):
+        self._storage = None
+        self._views = None  # read-only views of bot_settings, rebuilt after it changes
+
+        # Loaded once, since checking validity first would parse the file twice.
+        try:
+            self.bot_settings = dataIO.load_json("botSettings.json")
+        except FileNotFoundError:
+            self.bot_settings = None
+
+        if self.bot_settings is None:
             self.bot_settings = {"currActivity": "",
                                  "extensions": {"mamacog": {
                                      "load": True
@@ -20,36 +31,54 @@ class Settings:
                                      279092204771868672
                                  ]}
             self.save_bot_settings()
-        else:
-            self.bot_settings = dataIO.load_json("botSettings.json")
 
         self.check_extensions()
 
     def save_bot_settings(self):
-        """Saves self.bot_settings to a json in the data folder."""
-        dataIO.dump_json("botSettings.json", self.bot_settings)
+        """Queues self.bot_settings to be saved to a json in the data folder, without blocking."""
+        self._views = None
+        dataIO.dump_json_later("botSettings.json", self.bot_settings)
 
     def check_extensions(self):
+        """Adds new cogs to the extensions as disabled and drops missing ones, saving only if any changed."""
         extensions = list(filter(None, [file[:-3] if file[-3:] == '.py' and '__init__' not in file
                                         else None for file in listdir('cogs')]))
+        changed = False
 
         for extension in extensions:
             if extension not in self.extensions:
                 self.bot_settings['extensions'][extension] = {'load': False}
+                changed = True
 
-        for extension in self.extensions:
+        for extension in list(self.bot_settings['extensions']):
             if extension not in extensions:
                 self.bot_settings['extensions'].__delitem__(extension)
+                changed = True
 
-        self.save_bot_settings()
+        if changed:
+            self.save_bot_settings()
 
-    def disable_extension(self, extension):
+    def disable_extension(self, extension, *, save: bool = True):
         self.bot_settings['extensions'][extension]['load'] = False
-        self.save_bot_settings()
+        self._changed(save)
 
-    def enable_extension(self, extension):
+    def enable_extension(self, extension, *, save: bool = True):
         self.bot_settings['extensions'][extension]['load'] = True
-        self.save_bot_settings()
+        self._changed(save)
+
+    def set_activity(self, activity: str, *, save: bool = True):
+        self.bot_settings['currActivity'] = activity
+        self._changed(save)
+
+    def _changed(self, save: bool):
+        """
+        Call after changing bot_settings. save is False when applying a change another cluster
+        worker already saved, which only needs the views rebuilt.
+        """
+        if save:
+            self.save_bot_settings()
+        else:
+            self._views = None
 
     @property
     def current_activity(self):
@@ -65,36 +94,134 @@ class Settings:
 
         return token
 
+    @property
+    def storage(self):
+        """
+        The storage backend for keyed data like personalized.json, picked by the "storage" entry of
+        botSettings.json, e.g. {"backend": "sqlite", "path": "maneki.db"}. Defaults to the json files.
+
+        :rtype: JSONStorage or SQLiteStorage
+        """
+        if self._storage is None:
+            self._storage = open_storage(**self.bot_settings.get('storage', {'backend': 'json'}))
+        return self._storage
+
+    @property
+    def sharding(self):
+        """
+        Keyword arguments for AutoShardedBot from the "sharding" entry of botSettings.json, e.g.
+        {"shard_count": 4, "shard_ids": [0, 1]}. Without it, Discord's recommended shard count is used
+        and every shard runs in this process.
+
+        :rtype: dict
+        """
+        sharding = self.bot_settings.get('sharding', {})
+        return {key: sharding[key] for key in ('shard_count', 'shard_ids') if sharding.get(key) is not None}
+
+    @property
+    def log_config(self):
+        """
+        The "logging" entry of botSettings.json, e.g. {"format": "json", "rate_limits": {"discord": 5}}.
+        format is "text" (the default) or "json" for json lines. rate_limits caps the records per second
+        each line of code may log, by logger name.
+
+        :rtype: dict
+        """
+        return self.bot_settings.get('logging', {})
+
+    @property
+    def metrics_config(self):
+        """
+        The "metrics" entry of botSettings.json, e.g. {"file": "metrics.prom", "format": "prometheus",
+        "interval": 60}. When file is set, metrics are written there (in the data folder) every interval
+        seconds, in "prometheus" text or "json" format. Cluster workers add their id to the file name,
+        e.g. metrics-0.prom.
+
+        :rtype: dict
+        """
+        return self.bot_settings.get('metrics', {})
+
+    @property
+    def memory_config(self):
+        """
+        The "memory" entry of botSettings.json, picking a memory profile for the client's caches,
+        e.g. {"profile": "lean", "max_messages": 500}. See cogs.utils.memory.
+
+        :rtype: dict
+        """
+        return self.bot_settings.get('memory', {})
+
+    @property
+    def watchdog_config(self):
+        """
+        The "watchdog" entry of botSettings.json: keyword arguments for LoopWatchdog, such as
+        {"threshold": 0.5, "interval": 0.1}, or {"enabled": false} to turn it off.
+
+        :rtype: dict
+        """
+        return self.bot_settings.get('watchdog', {})
+
+    def _view(self, name: str):
+        """
+        Returns one of the cached read-only views of bot_settings. They're built together on first
+        access after bot_settings changes, since save_bot_settings is called after every change.
+        """
+        if self._views is None:
+            extensions = {name: MappingProxyType(dict(extension))
+                          for name, extension in self.bot_settings['extensions'].items()}
+            permissions = self.bot_settings.get('permissions', {})
+            self._views = {
+                'guardians': frozenset(self.bot_settings['guardians']),
+                'permissions': MappingProxyType({
+                    'admin_roles': {int(guild): frozenset(roles)
+                                    for guild, roles in permissions.get('admin_roles', {}).items()},
+                    'commands': {name: (frozenset(lists.get('allow', ())), frozenset(lists.get('deny', ())))
+                                 for name, lists in permissions.get('commands', {}).items()},
+                }),
+                'extensions': MappingProxyType(extensions),
+                'loaded': MappingProxyType({k: v for k, v in extensions.items() if v['load']}),
+                'unloaded': MappingProxyType({k: v for k, v in extensions.items() if not v['load']}),
+            }
+        return self._views[name]
+
     @property
     def guardians(self):
-        return self.bot_settings['guardians'].copy()
+        """
+        IDs of the bot's guardians.
+
+        :rtype: frozenset
+        """
+        return self._view('guardians')
+
+    @property
+    def permissions(self):
+        """
+        Hash-set form of the "permissions" entry: {'admin_roles': {guild id: frozenset of role ids},
+        'commands': {command name: (allow frozenset, deny frozenset)}}. A new object after every change.
+
+        :rtype: MappingProxyType
+        """
+        return self._view('permissions')
 
     @property
     def extensions(self):
         """
-        Copy of all extensions for the bot.
+        Read-only view of all extensions for the bot.
 
         :return: the bot's extensions
-        :rtype: dict
+        :rtype: MappingProxyType
         """
-        return deepcopy(self.bot_settings['extensions'])
+        return self._view('extensions')
 
     @property
     def loaded_extensions(self):
-        ret = {}
-        for extension in self.extensions:
-            if self.extensions[extension]['load']:
-                ret[extension] = self.extensions[extension]
-        return ret
+        return self._view('loaded')
 
     @property
     def unloaded_extensions(self):
-        ret = {}
-        for extension in self.extensions:
-            if not self.extensions[extension]['load']:
-                ret[extension] = self.extensions[extension]
-        return ret
+        return self._view('unloaded')
 
 
 # TODO: Remove need to instantiate Settings object outside of Maneki
-settings = Settings()
+with boot.phase('settings'):
+    settings = Settings()
@@ -0,0 +1,89 @@
+import math
+import time
+from collections import Counter
+
+
+def shard_for(guild_id: int, shard_count: int):
+    """
+    Returns the shard Discord delivers a guild's events on.
+
+    :rtype: int
+    """
+    return (int(guild_id) >> 22) % shard_count
+
+
+class ShardStats:
+    """
+    Per-shard gateway event rates, counted in one-second buckets over a rolling window so the
+    memory used stays fixed. Events carrying a guild ID are counted on that guild's shard, and
+    everything else, such as DMs, on shard 0, where Discord sends them.
+    """
+
+    def __init__(self, window: int = 60):
+        """
+        :param window: Seconds of history the event rate is averaged over
+        """
+        self.window = window
+        self.events = Counter()  # shard id -> events since boot
+        self.ready_at = {}  # shard id -> time.time() of the shard's last READY
+        self._counts = {}  # shard id -> [events in each second of the window]
+        self._seconds = {}  # shard id -> [which second each bucket currently holds]
+
+    def record(self, payload: dict, shard_count: int = 1):
+        """
+        Counts a raw gateway payload, as passed to the socket_response event.
+
+        :param shard_count: Total number of shards the bot's guilds are spread over
+        """
+        if payload.get('op') != 0:
+            return
+
+        data = payload.get('d')
+        guild_id = data.get('guild_id') if isinstance(data, dict) else None
+        if guild_id is None and payload.get('t') == 'GUILD_CREATE':
+            guild_id = data.get('id')
+        shard_id = shard_for(guild_id, shard_count) if guild_id is not None else 0
+
+        now = int(time.monotonic())
+        slot = now % self.window
+        seconds = self._seconds.get(shard_id)
+        if seconds is None:
+            seconds = self._seconds[shard_id] = [None] * self.window
+            self._counts[shard_id] = [0] * self.window
+        if seconds[slot] != now:
+            seconds[slot] = now
+            self._counts[shard_id][slot] = 0
+        self._counts[shard_id][slot] += 1
+        self.events[shard_id] += 1
+
+    def rate(self, shard_id: int):
+        """
+        Returns the shard's average events per second over the window.
+
+        :rtype: float
+        """
+        seconds = self._seconds.get(shard_id)
+        if seconds is None:
+            return 0.0
+        oldest = int(time.monotonic()) - self.window
+        counts = self._counts[shard_id]
+        return sum(count for second, count in zip(seconds, counts)
+                   if second is not None and second > oldest) / self.window
+
+    def mark_ready(self, shard_id: int):
+        self.ready_at[shard_id] = time.time()
+
+    def report(self, bot):
+        """
+        Returns a row of stats for every shard the bot runs.
+
+        :return: [{'shard', 'latency', 'guilds', 'rate', 'events', 'ready_at'}, ...] sorted by shard
+        :rtype: list
+        """
+        # A shard's latency is nan until its first heartbeat is acknowledged.
+        latencies = {shard_id: None if math.isnan(latency) else latency for shard_id, latency in bot.latencies}
+        guilds = Counter(guild.shard_id for guild in bot.guilds)
+        return [{'shard': shard_id, 'latency': latencies.get(shard_id), 'guilds': guilds[shard_id],
+                 'rate': self.rate(shard_id), 'events': self.events[shard_id],
+                 'ready_at': self.ready_at.get(shard_id)}
+                for shard_id in sorted(set(bot.shard_ids or latencies) | set(guilds))]
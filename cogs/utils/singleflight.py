@@ -0,0 +1,44 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key. The first caller starts the call, and everyone who
+    asks for that key before it finishes awaits the same result (or exception) instead of making
+    their own. Once it finishes, the next call for the key starts a new one.
+
+    Ex: flights = SingleFlight()
+        data = await flights.do(url, fetch_json, url)
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    async def do(self, key, func, *args, **kwargs):
+        """
+        Returns the result of func(*args, **kwargs), sharing an in-flight call for key if one exists.
+        A caller being cancelled doesn't cancel the call for the others waiting on it.
+
+        :param key: Anything hashable identifying the call, such as a URL or query
+        :param func: The coroutine function making the call
+        """
+        future = self._calls.get(key)
+
+        if future is None:
+            future = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._finished(key, done))
+
+        return await asyncio.shield(future)
+
+    def _finished(self, key, future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            future.exception()  # retrieved, in case every caller gave up waiting
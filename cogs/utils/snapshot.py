@@ -0,0 +1,79 @@
+"""
+Versioned binary snapshots of data that is expensive to rebuild from its json source, such as
+TalkerCog's compiled rule set. A snapshot is stored with the stamp of the sources it was built from
+and is only used while that stamp still matches, so editing the json regenerates it. Snapshots are
+also tied to the source of the modules defining the snapshotted classes, so changing that code
+regenerates them without VERSION having to be bumped.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import sys
+from random import randint
+
+from .dataIO import dataIO
+
+# Bump whenever the layout of a snapshotted structure changes.
+VERSION = 1
+
+# Modules, in cogs/utils, whose classes end up in snapshots.
+SOURCES = ('matcher.py', 'prefilter.py')
+
+_logger = logging.getLogger("maneki")
+
+
+def _source_hash():
+    digest = hashlib.sha1()
+    for source in SOURCES:
+        with open(os.path.join(os.path.dirname(__file__), source), 'rb') as fp:
+            digest.update(fp.read())
+    return digest.hexdigest()
+
+
+_SOURCE_HASH = _source_hash()
+
+
+def _path(name: str):
+    return os.path.join(dataIO.path, 'cache', f"{name}.snapshot")
+
+
+def _header(stamp):
+    return VERSION, sys.version_info[:2], _SOURCE_HASH, stamp
+
+
+def load(name: str, stamp, build):
+    """
+    Returns the snapshot called name if it was saved with the same stamp, otherwise returns
+    build() and saves its result as the new snapshot.
+
+    :param name: Name of the snapshot file in data/cache
+    :param stamp: Any picklable value that changes whenever the sources do, like their mtimes
+    :param build: Called with no arguments to build the data from its sources
+    """
+    try:
+        with open(_path(name), 'rb') as fp:
+            if pickle.load(fp) == _header(stamp):
+                return pickle.load(fp)
+    except FileNotFoundError:
+        pass
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError, ValueError):
+        _logger.warning(f"Snapshot {name} is unreadable, rebuilding it.")
+
+    data = build()
+    save(name, stamp, data)
+    return data
+
+
+def save(name: str, stamp, data):
+    """Atomically saves data as the snapshot called name, built from sources with the given stamp."""
+    path = _path(name)
+    tmp_file = f"{os.path.splitext(path)[0]}-{os.getpid()}-{randint(1000, 9999)}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(tmp_file, 'wb') as fp:
+            pickle.dump(_header(stamp), fp, protocol = pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, fp, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, path)
+    except (OSError, pickle.PicklingError):
+        _logger.exception(f"Saving snapshot {name} failed.")
@@ -0,0 +1,275 @@
+"""
+Pluggable storage for Maneki's keyed data, such as personalized.json.
+
+Both backends expose DataIO's document calls (load_json, dump_json) along with keyed calls that
+read or change a single top-level entry of a document. JSONStorage keeps using the files in data/.
+SQLiteStorage keeps every document in one SQLite database in WAL mode, one row per top-level key, so
+changing one user's entry writes one row instead of the whole file.
+
+To move existing files into SQLite:
+
+    python -m cogs.utils.storage migrate --db maneki.db conversation/personalized.json
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from os.path import join
+
+from .dataIO import dataIO
+
+# Documents whose top-level keys are user or guild IDs, so their rows are indexed by them.
+KEYED_BY = {'conversation/personalized.json': 'user'}
+
+
+class JSONStorage:
+    """Storage backed by the json files in data/, through DataIO."""
+
+    def load_json(self, file: str, *, copy: bool = True):
+        return dataIO.load_json(file, copy = copy)
+
+    def dump_json(self, file: str, data: dict):
+        dataIO.dump_json(file, data)
+
+    def stamp(self, file: str):
+        """Returns a value that changes whenever the document does, or None if it doesn't exist."""
+        file = join(dataIO.path, file) if dataIO.path not in file else file
+        try:
+            stat = os.stat(file)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, file: str, key: str, default = None):
+        """Returns one entry from DataIO's cache of the file. It's shared, so it must not be changed."""
+        return self.load_json(file, copy = False).get(key, default)
+
+    def set(self, file: str, key: str, value, **ids):
+        data = self.load_json(file)
+        data[key] = value
+        self.dump_json(file, data)
+
+    def delete(self, file: str, key: str):
+        data = self.load_json(file)
+        if key in data:
+            del data[key]
+            self.dump_json(file, data)
+
+    @contextmanager
+    def batch(self):
+        yield self
+
+    async def load_json_async(self, file: str, *, copy: bool = True):
+        return await dataIO.load_json_async(file, copy = copy)
+
+    async def dump_json_async(self, file: str, data: dict):
+        return await dataIO.dump_json_async(file, data)
+
+
+class SQLiteStorage:
+    """
+    Storage backed by a SQLite database in WAL mode. Each top-level key of a document is a row,
+    so keyed reads and writes cost the same no matter how big the document grows.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS documents (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            user_id INTEGER,
+            guild_id INTEGER,
+            updated REAL NOT NULL,
+            PRIMARY KEY (namespace, key)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS documents_user ON documents (user_id) WHERE user_id IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS documents_guild ON documents (guild_id) WHERE guild_id IS NOT NULL;
+        CREATE TABLE IF NOT EXISTS namespaces (
+            namespace TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path: str = 'maneki.db'):
+        """
+        :param path: The database file, relative to the data folder
+        """
+        self.path = join(dataIO.path, path) if dataIO.path not in path else path
+
+        # One connection shared by the event loop and DataIO's pool threads, serialized by a lock.
+        self._db = sqlite3.connect(self.path, check_same_thread = False, isolation_level = None)
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._touched = set()
+
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode = WAL")
+            self._db.execute("PRAGMA synchronous = NORMAL")
+            self._db.executescript(self.SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups every write made inside it into one transaction. Batches can be nested, and only the
+        outermost commits (or rolls back, if it raises).
+        """
+        with self._lock:
+            if self._depth == 0:
+                self._db.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._touched.clear()
+                    self._db.execute("ROLLBACK")
+                raise
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    for namespace in self._touched:
+                        self._db.execute("INSERT INTO namespaces VALUES (?, 1) ON CONFLICT (namespace) "
+                                         "DO UPDATE SET version = version + 1", (namespace,))
+                    self._touched.clear()
+                    self._db.execute("COMMIT")
+
+    @staticmethod
+    def _ids(file: str, key: str, ids: dict):
+        """Returns the user and guild IDs to index a row by, inferring them for documents in KEYED_BY."""
+        user_id, guild_id = ids.get('user_id'), ids.get('guild_id')
+        keyed_by = KEYED_BY.get(file)
+        if keyed_by is not None and key.isdigit():
+            if keyed_by == 'user' and user_id is None:
+                user_id = int(key)
+            elif keyed_by == 'guild' and guild_id is None:
+                guild_id = int(key)
+        return user_id, guild_id
+
+    def get(self, file: str, key: str, default = None):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM documents WHERE namespace = ? AND key = ?",
+                                   (file, key)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set(self, file: str, key: str, value, **ids):
+        """
+        Inserts or replaces one top-level entry of a document.
+
+        :param ids: user_id and/or guild_id to index the entry by
+        """
+        user_id, guild_id = self._ids(file, key, ids)
+        with self.batch():
+            self._db.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+                             (file, key, json.dumps(value), user_id, guild_id, time.time()))
+            self._touched.add(file)
+
+    def delete(self, file: str, key: str):
+        with self.batch():
+            self._db.execute("DELETE FROM documents WHERE namespace = ? AND key = ?", (file, key))
+            self._touched.add(file)
+
+    def for_user(self, user_id: int):
+        """Returns {(document, key): value} for every entry indexed by the user."""
+        with self._lock:
+            rows = self._db.execute("SELECT namespace, key, value FROM documents WHERE user_id = ?",
+                                    (user_id,)).fetchall()
+        return {(namespace, key): json.loads(value) for namespace, key, value in rows}
+
+    def for_guild(self, guild_id: int):
+        """Returns {(document, key): value} for every entry indexed by the guild."""
+        with self._lock:
+            rows = self._db.execute("SELECT namespace, key, value FROM documents WHERE guild_id = ?",
+                                    (guild_id,)).fetchall()
+        return {(namespace, key): json.loads(value) for namespace, key, value in rows}
+
+    def load_json(self, file: str, *, copy: bool = True):
+        """Returns the whole document as a dict, like DataIO.load_json. Always a fresh dict."""
+        with self._lock:
+            rows = self._db.execute("SELECT key, value FROM documents WHERE namespace = ? ORDER BY key",
+                                    (file,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def dump_json(self, file: str, data: dict):
+        """Replaces the whole document, like DataIO.dump_json, in one transaction."""
+        with self.batch():
+            self._db.execute("DELETE FROM documents WHERE namespace = ?", (file,))
+            for key, value in data.items():
+                self.set(file, key, value)
+            self._touched.add(file)
+
+    def stamp(self, file: str):
+        """Returns a value that changes whenever the document does, or None if it was never written."""
+        with self._lock:
+            row = self._db.execute("SELECT version FROM namespaces WHERE namespace = ?", (file,)).fetchone()
+        return None if row is None else row[0]
+
+    async def load_json_async(self, file: str, *, copy: bool = True):
+        return await dataIO.run_in_pool(self.load_json, file)
+
+    async def dump_json_async(self, file: str, data: dict):
+        return await dataIO.run_in_pool(self.dump_json, file, data)
+
+
+def open_storage(backend: str = 'json', **options):
+    """
+    Returns the storage backend by name.
+
+    :param backend: 'json' or 'sqlite'
+    :param options: Passed to the backend, e.g. path for sqlite
+    :raises: ValueError
+    """
+    if backend == 'json':
+        return JSONStorage()
+    if backend == 'sqlite':
+        return SQLiteStorage(**options)
+    raise ValueError(f"Unknown storage backend {backend}")
+
+
+def migrate(files: list, db: str = 'maneki.db'):
+    """
+    Copies json documents from the data folder into a SQLite store, each in a single transaction.
+    The json files are left in place.
+
+    :return: {file: entries copied}
+    :rtype: dict
+    """
+    store = SQLiteStorage(db)
+    copied = {}
+    try:
+        for file in files:
+            data = dataIO.load_json(file, copy = False)
+            if data is None:
+                raise ValueError(f"{file} isn't valid json.")
+            store.dump_json(file, data)
+            copied[file] = len(data)
+    finally:
+        store.close()
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Maneki storage tools.")
+    commands = parser.add_subparsers(dest = 'command')
+    migrate_cmd = commands.add_parser('migrate', help = "Copy json files from data/ into a SQLite store.")
+    migrate_cmd.add_argument('files', nargs = '*', default = list(KEYED_BY),
+                             help = "Files relative to data/ (default: the keyed documents).")
+    migrate_cmd.add_argument('--db', default = 'maneki.db', help = "Database file relative to data/.")
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        for file, count in migrate(args.files, args.db).items():
+            print(f"{file}: {count} entries migrated")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@ import re
 from pprint import pprint
 from itertools import islice
 
+_UNCLEAN = re.compile(r'[^a-z\d\s]+')
+
 
 class TextFormatter:
     def regscan(self, string: str, regex: iter, *, clean_str: bool = True):
@@ -40,7 +42,7 @@ class TextFormatter:
         :param lower: If cleaned string is lowercase
         """
 
-        return re.sub(r'[^a-z\d\s]+', '', string.lower() if lower else string)
+        return _UNCLEAN.sub('', string.lower() if lower else string)
 
     @staticmethod
     def deblank(iterable: iter):
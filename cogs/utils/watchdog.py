@@ -0,0 +1,112 @@
+"""
+Finds code that blocks Maneki's event loop.
+
+A heartbeat task measures how late the loop wakes it, which is the delay every other task and
+event on the loop sees too. A watchdog thread checks on the heartbeat, and when the loop has been
+stuck for longer than the threshold it captures the loop thread's stack, so the log says which
+handler, cog or command was holding it and the stall counts are kept per location in metrics.
+"""
+import asyncio
+import inspect
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from .metrics import metrics
+
+_logger = logging.getLogger("maneki")
+
+
+def _name(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class LoopWatchdog:
+    def __init__(self, loop, *, interval: float = 0.1, threshold: float = 0.5, enabled: bool = True):
+        """
+        :param loop: The event loop to watch
+        :param interval: Seconds between heartbeats, and between the watchdog's checks
+        :param threshold: Seconds the loop may be blocked before the stall is captured and logged
+        :param enabled: False to not start watching at all
+        """
+        self.loop = loop
+        self.interval = interval
+        self.threshold = threshold
+        self.enabled = enabled
+        self.stalls = Counter()  # location -> stalls captured there
+
+        self._beat = time.monotonic()
+        self._loop_thread = None
+        self._stall = None  # (location, handlers) captured during the current stall
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target = self._watch, name = 'loop-watchdog', daemon = True)
+        self._heartbeat = None
+
+    def start(self):
+        if self.enabled and self._heartbeat is None:
+            self._heartbeat = self.loop.create_task(self._run_heartbeat())
+
+    def stop(self):
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+
+    async def _run_heartbeat(self):
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._thread.start()
+
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._beat = now = time.monotonic()
+            lag = now - start - self.interval
+            metrics.record('loop', 'lag', lag)
+
+            if lag >= self.threshold:
+                stall, self._stall = self._stall, None
+                if stall is None:
+                    metrics.record('stall', '<not captured>', lag)
+                    _logger.warning(f"Event loop was blocked for {lag * 1000:.0f} ms, "
+                                    f"too briefly for the watchdog to see where.")
+                else:
+                    metrics.record('stall', stall[0], lag)
+                    _logger.warning(f"Event loop was blocked for {lag * 1000:.0f} ms in {stall[0]}, "
+                                    f"{self.stalls[stall[0]]} stalls there so far.")
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            blocked = time.monotonic() - self._beat - self.interval
+            if blocked >= self.threshold and self._stall is None:
+                self._stall = self._capture(blocked)
+
+    def _capture(self, blocked: float):
+        """Logs the loop thread's stack and returns where it is stuck and which handlers are running."""
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return None
+
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        frames.reverse()  # outermost first
+
+        # The coroutines being run, such as Maneki._run_event > TalkerCog.on_message.
+        handlers = ' > '.join(_name(frame) for frame in frames if frame.f_code.co_flags & inspect.CO_COROUTINE)
+        # The innermost frame of Maneki's own code, else the innermost frame at all.
+        own = [frame for frame in frames
+               if frame.f_globals.get('__name__', '').split('.')[0] in ('cogs', 'maneki', '__main__')]
+        where = own[-1] if own else frames[-1]
+        location = f"{_name(where)}:{where.f_lineno}"
+
+        self.stalls[location] += 1
+        stack = ''.join(traceback.format_list(traceback.StackSummary.extract(
+            ((frame, frame.f_lineno) for frame in frames), lookup_lines = True)))
+        _logger.warning(f"Event loop blocked for over {blocked * 1000:.0f} ms in {location}, "
+                        f"running {handlers or 'no coroutine'}:\n{stack}")
+        return location, handlers
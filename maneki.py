@@ -1,47 +1,260 @@
+from cogs.utils.boot import boot  # first, so boot timings start as early as possible
+import asyncio
 import os
 import sys
 import platform
 import time
+import aiohttp
 import discord
 from discord.ext import commands
 import logging
-from logging.handlers import RotatingFileHandler
+from cogs.utils import checks, loader, logs, memory
+from cogs.utils.dataIO import dataIO
+from cogs.utils.metrics import metrics
+from cogs.utils.permissions import permissions
 from cogs.utils.settings import settings
+from cogs.utils.shards import ShardStats
+from cogs.utils.watchdog import LoopWatchdog
 
+boot.mark('imported')
 
-class Maneki(commands.Bot):
+# Limits for the shared outbound HTTP session.
+HTTP_POOL_SIZE = 100  # open connections in total
+HTTP_POOL_PER_HOST = 20  # open connections to any one host
+HTTP_KEEPALIVE = 30  # seconds an idle connection is kept for reuse
+HTTP_DNS_TTL = 300  # seconds a DNS lookup is cached
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total = 10, connect = 3)
+
+
+class Maneki(commands.AutoShardedBot):
     """
     Framework for a bot, designed to be used with cogs and not as a stand-alone.
-    Will eventually be converted to use the AutoShardedBot class instead of Bot.
+    Runs the shards given by the "sharding" entry of botSettings.json, or all of Discord's
+    recommended shards if there isn't one, with client caches sized by its "memory" entry.
     """
 
-    def __init__(self, *args, **kwargs):
-        self.logger = set_logger()
+    def __init__(self, *args, cluster_id: int = None, **kwargs):
+        """
+        :param cluster_id: This worker's index when run by cluster.py, which keeps its log and metrics
+            files apart from the other workers'
+        """
+        self.cluster_id = cluster_id
+        self.logger = set_logger(cluster_id)
+        self._session = None
+        self.shard_stats = ShardStats()
+        self.ipc = None  # a WorkerIPC when run by cluster.py
+        self.lazy_extensions = {}  # extension -> LazyExtension, for lazy cogs not used yet
+        self._booted = False
 
+        kwargs = {**settings.sharding, **memory.client_options(settings.memory_config), **kwargs}
         super().__init__(*args, activity = discord.Game(name = settings.current_activity),
                          command_prefix = "!!", **kwargs)
 
-    # Bot startup output
+        self.add_check(checks.check_command_allowed)
+        self.before_invoke(self._start_command_timer)
+        self.after_invoke(self._stop_command_timer)
+        self._metrics_export = self.loop.create_task(self.export_metrics()) if settings.metrics_config else None
+        self.watchdog = LoopWatchdog(self.loop, **settings.watchdog_config)
+        self.watchdog.start()
+
+    @property
+    def session(self):
+        """
+        The aiohttp session shared by every cog for outbound requests. Connections are pooled and kept
+        alive between commands. Created on first use and closed with the bot.
+
+        :rtype: aiohttp.ClientSession
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit = HTTP_POOL_SIZE, limit_per_host = HTTP_POOL_PER_HOST,
+                                             keepalive_timeout = HTTP_KEEPALIVE, ttl_dns_cache = HTTP_DNS_TTL)
+            self._session = aiohttp.ClientSession(connector = connector, timeout = HTTP_TIMEOUT)
+        return self._session
+
+    async def login(self, *args, **kwargs):
+        with boot.phase('login'):
+            await super().login(*args, **kwargs)
+        boot.mark('logged in')
+
+    async def close(self):
+        self.watchdog.stop()
+        if self._metrics_export is not None:
+            self._metrics_export.cancel()
+        if self.ipc is not None:
+            self.ipc.stop()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        await super().close()
+        dataIO.flush()
+        stop_logger()
+
+    def dispatch(self, event, *args, **kwargs):
+        # Counted here rather than in an on_socket_response listener, which would be a task per event.
+        if event == 'socket_response':
+            self.shard_stats.record(args[0], self.shard_count or 1)
+        super().dispatch(event, *args, **kwargs)
+
+    async def on_shard_ready(self, shard_id):
+        self.shard_stats.mark_ready(shard_id)
+        guilds = sum(1 for guild in self.guilds if guild.shard_id == shard_id)
+        self.logger.info(f"Shard {shard_id} of {self.shard_count} ready with {guilds} guilds.")
+
+    # Bot startup output, once every shard is ready
     async def on_ready(self):
+        if self._booted:
+            self.logger.info(f"All shards ready again, in {len(self.guilds)} guilds.")
+            return
+        self._booted = True
+        boot.mark('ready')
+
         print(f"{time.ctime()} :: Booted as {self.user.name} (ID - {self.user.id})")
+        # shard_ids stays None unless it was passed in, but every running shard reports a latency.
+        shard_ids = sorted(shard_id for shard_id, _ in self.latencies)
+        print(f"Shards: {', '.join(str(shard_id) for shard_id in shard_ids)} of {self.shard_count}")
         print(f"Playing game: {settings.current_activity}\n")
         print("Connected guilds:\n" + '\n'.join([f"\t{guild.id} > {guild.name}" for guild in self.guilds]))
         print(f"Discord.py API version: {discord.__version__}")
         print(f"Python version: {platform.python_version()}")
         print(f"Running on: {platform.system()} {platform.release()} ({os.name})\n\n")
+        boot.log(self.logger)
+
+    # Metrics
+
+    @staticmethod
+    async def _start_command_timer(ctx):
+        ctx.started = time.perf_counter()
+
+    @staticmethod
+    async def _stop_command_timer(ctx):
+        metrics.record('command', ctx.command.qualified_name, time.perf_counter() - ctx.started,
+                       ctx.command_failed)
+
+    async def on_command_error(self, ctx, error):
+        metrics.count('command_error', type(error).__name__)
+        await super().on_command_error(ctx, error)
+
+    async def _run_event(self, coro, event_name, *args, **kwargs):
+        name = getattr(coro, '__qualname__', event_name)
+
+        # Timed around the listener itself, since super()._run_event hands its exceptions to on_error.
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            error = False
+            try:
+                await coro(*args, **kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                error = True
+                raise
+            finally:
+                metrics.record('listener', name, time.perf_counter() - start, error)
+
+        await super()._run_event(timed, event_name, *args, **kwargs)
+
+    async def export_metrics(self):
+        """Writes the metrics to the file set in botSettings.json every interval seconds."""
+        config = settings.metrics_config
+        file = config.get('file')
+        if file is None:
+            return
+        if self.cluster_id is not None:
+            # Each cluster worker has its own metrics, so each writes its own file.
+            root, ext = os.path.splitext(file)
+            file = f"{root}-{self.cluster_id}{ext}"
+
+        while not self.is_closed():
+            await asyncio.sleep(config.get('interval', 60))
+            try:
+                await metrics.export(file, config.get('format', 'prometheus'))
+            except OSError:
+                self.logger.exception(f"Writing metrics to {file} failed.")
+
+    # Changes made on other cluster workers, already saved by the worker that made them.
+    async def on_ipc_activity(self, data):
+        settings.set_activity(data['name'], save = False)
+        await self.change_presence(activity = discord.Game(name = data['name']))
+
+    async def on_ipc_extension(self, data):
+        extension, action = data['name'], data['action']
+        try:
+            if action == 'unload':
+                loader.unload(self, extension)
+            elif action == 'reload':
+                await loader.reload(self, extension)
+            else:
+                await loader.load(self, extension)
+        except Exception:
+            self.logger.exception(f"Failed to {action} {extension} as another cluster worker did.")
+            return
+
+        if action == 'load':
+            settings.enable_extension(extension, save = False)
+        elif action == 'unload':
+            settings.disable_extension(extension, save = False)
+
+    # Cached permissions follow role changes.
+    async def on_member_update(self, before, after):
+        if before.roles != after.roles:
+            permissions.invalidate(after.guild.id, after.id)
+
+    async def on_member_remove(self, member):
+        permissions.invalidate(member.guild.id, member.id)
+
+    async def on_guild_role_delete(self, role):
+        permissions.invalidate(role.guild.id)
 
     def load_cogs(self):
+        """
+        Imports every enabled cog that isn't lazy in parallel and sets them up one by one, then
+        registers stubs for the lazy cogs. Cogs that fail to load are disabled.
+        """
         print("Loading cogs...")
-        for cog in settings.loaded_extensions:
+        eager, lazy = [], {}
+        with boot.phase('cogs'):
+            for cog, extension in settings.loaded_extensions.items():
+                if extension.get('lazy'):
+                    found, listens = loader.discover(cog)
+                    if found and not listens:
+                        lazy[cog] = found
+                        continue
+                    print(f"\t{cog} can't be lazy, it listens for events or has no commands.")
+                eager.append(cog)
+
+            self._load_extensions(eager)
+
+            # Stubs go in once every eager cog's commands are registered, so any name clash shows up
+            # here and the cog is loaded now instead.
+            clashed = []
+            for cog, found in lazy.items():
+                stub = loader.LazyExtension(self, cog, found)
+                try:
+                    stub.install()
+                except discord.ClientException as e:
+                    print(f"\t{cog} can't be lazy: {e}")
+                    clashed.append(cog)
+                else:
+                    self.lazy_extensions[cog] = stub
+                    boot.cog(cog, lazy_commands = len(found))
+                    print(f"\t{cog} deferred until one of {', '.join(stub.names)} is used.")
+
+            self._load_extensions(clashed)
+        print("Cogs loaded.\n")
+
+    def _load_extensions(self, cogs: list):
+        """Imports the cogs in parallel and sets them up one by one, disabling any that fail to load."""
+        for cog, imported in loader.preload(cogs).items():
             print(f"\tLoading {cog}...")
             try:
+                boot.cog(cog, imported = imported.result())
+                start = time.perf_counter()
                 self.load_extension(f"cogs.{cog}")
+                boot.cog(cog, setup = time.perf_counter() - start)
                 print(f"\t{cog} loaded.")
             except (discord.ClientException, ImportError) as e:
                 print(f"\tFailed to load {cog} || {type(e)}: {e}")
                 settings.disable_extension(cog)
                 print(f"\tDisabling {cog}.")
-        print("Cogs loaded.\n")
 
     async def send_cmd_help(self, ctx):
         if ctx.invoked_subcommand:
@@ -54,37 +267,53 @@ class Maneki(commands.Bot):
                 await ctx.send(page)
 
 
-def set_logger():
-    # TODO: optimize loggers for Maneki
+def set_logger(cluster_id: int = None):
+    """
+    Sets up the "maneki" and "discord" loggers. Their records are queued and written by a listener
+    thread, so logging never waits on the disk. Maneki logs to stdout and maneki.log, discord.py's
+    warnings go to discord.log, and both files rotate at 10 MB.
+
+    :param cluster_id: Set in cluster workers, which log to maneki-<cluster_id>.log and
+        discord-<cluster_id>.log, since a rotating file can't be shared between processes
+    :rtype: logging.Logger
+    """
+    global _log_listener
+    config = settings.log_config
+    neki_format = logs.JSONFormatter() if config.get('format') == 'json' else logs.TEXT_FORMAT
+
     logger = logging.getLogger("maneki")
     logger.setLevel(logging.INFO)
-
-    neki_format = logging.Formatter(
-        '%(asctime)s %(levelname)s %(module)s %(funcName)s %(lineno)d: '
-        '%(message)s',
-        datefmt = "[%Y-%m-%d:%H:%M]")
+    dpy_logger = logging.getLogger("discord")
+    dpy_logger.setLevel(logging.WARNING)
 
     stdout_handler = logging.StreamHandler(sys.stdout)
     stdout_handler.setFormatter(neki_format)
     stdout_handler.setLevel(logging.INFO)
+    stdout_handler.addFilter(logging.Filter("maneki"))
 
-    fhandler = RotatingFileHandler(
-        filename = 'data/logs/maneki.log', encoding = 'utf-8', mode = 'a',
-        maxBytes = 10 ** 7, backupCount = 3)
-    fhandler.setFormatter(neki_format)
+    suffix = '' if cluster_id is None else f"-{cluster_id}"
+    fhandler = logs.rotating_file(f'data/logs/maneki{suffix}.log', neki_format)
+    fhandler.addFilter(logging.Filter("maneki"))
 
-    logger.addHandler(fhandler)
-    logger.addHandler(stdout_handler)
+    handler = logs.rotating_file(f'data/logs/discord{suffix}.log', neki_format)
+    handler.addFilter(logging.Filter("discord"))
 
-    dpy_logger = logging.getLogger("discord")
-    dpy_logger.setLevel(logging.WARNING)
+    if _log_listener is not None:
+        logs.stop_queue(_log_listener)
+    _log_listener = logs.start_queue([logger, dpy_logger], [stdout_handler, fhandler, handler],
+                                     config.get('rate_limits'))
+    return logger
 
-    handler = logging.FileHandler(
-        filename = 'data/logs/discord.log', encoding = 'utf-8', mode = 'a')
-    handler.setFormatter(neki_format)
-    dpy_logger.addHandler(handler)
 
-    return logger
+def stop_logger():
+    """Writes out the queued log records and stops the listener thread."""
+    global _log_listener
+    if _log_listener is not None:
+        logs.stop_queue(_log_listener)
+        _log_listener = None
+
+
+_log_listener = None
 
 
 if __name__ == '__main__':